@@ -40,42 +40,95 @@ import pathlib
 import polars as pl
 
 import scl_dfutil
+import scl_fsutil
 import scl_libfceanalyze
 import scl_libvivanalyze
+import scl_log
+import scl_perf
+import scl_sqlcatalog
 
 CONFIG = {
     "opt_alwaysparseVIV" : 1  # if False, only parse VIV files if JSON does not exist
+    , "opt_incrementalVIV" : 0  # if True and JSON exists, only parse new or changed VIV files
     , "opt_alwaysparseFCE" : 1  # if False, only parse FCE files if JSON does not exist
+    , "opt_incrementalFCE" : 0  # if True and JSON exists, only parse new or changed FCE files
     , "opt_FCEondisk" : True  # if True, also parse FCE files on disk
-    , "viv_archives_path" : "./viv_archives.json"
-    , "fce_archives_path" : "./fce_files.json"
+    , "opt_hashFCE" : False  # if True, hash FCE data (column "hash"); always on with SQLite catalog
+    , "viv_archives_path" : "./viv_archives.json"  # .json, .parquet, .arrow or .ndjson (streamed while scanning)
+    , "fce_archives_path" : "./fce_files.json"  # .json, .parquet or .arrow; fedata is written to ./fce_files_fedata.json
+    , "sqlite_path" : None  # if set, e.g. "./catalog.sqlite", also write indexed SQLite catalog, see bfut_vivfcequery.py
+    , "jobs" : 1  # worker processes for probing archives and decoding FCE files, 0 uses all cores
 }
 
 # Parse command (or print module help)
 parser = argparse.ArgumentParser()
 parser.add_argument("path", nargs="+", help="<path/to/folder>")
-args = parser.parse_args()
-inpath = pathlib.Path(args.path[0])
-
-print(f"inpath: '{inpath}'")
+parser.add_argument("--header-only", action="store_true", help="read FCE headers only, skip mesh decoding")
+parser.add_argument("-j", "--jobs", type=int, default=CONFIG["jobs"], help="worker processes for probing archives and decoding FCE files, 0 uses all cores")
+parser.add_argument("--include", action="append", default=[], help="only scan files matching glob (repeatable)")
+parser.add_argument("--exclude", action="append", default=[], help="skip files matching glob (repeatable)")
+parser.add_argument("--prune", action="append", default=[], help="skip directories matching glob, e.g. Backup (repeatable)")
+parser.add_argument("--one-file-system", action="store_true", help="do not descend into other filesystems")
+parser.add_argument("--readahead", type=int, default=scl_fsutil.CONFIG["readahead"], help="files hinted to the OS ahead of the reader (serial runs), 0 disables")
+verbosity = parser.add_mutually_exclusive_group()
+verbosity.add_argument("-q", "--quiet", action="store_true", help="print warnings and errors only")
+verbosity.add_argument("-v", "--verbose", action="store_true", help="print every file and FCE entry")
+parser.add_argument("--sqlite", default=CONFIG["sqlite_path"], help="also write SQLite catalog to file, query with bfut_vivfcequery.py")
+parser.add_argument("--hash", action="store_true", default=CONFIG["opt_hashFCE"], help="hash FCE data to find copies, implied by --sqlite")
+parser.add_argument("--timing", action="store_true", help="print per-stage timing summary")
+parser.add_argument("--timing-json", help="write per-stage timing summary to JSON file")
 
 def main():
+    args = parser.parse_args()
+    inpath = pathlib.Path(args.path[0])
+    scl_fsutil.CONFIG.update({
+        "include": args.include,
+        "exclude": args.exclude,
+        "prune": args.prune,
+        "same_device": args.one_file_system,
+        "readahead": args.readahead,
+    })
+    if args.timing or args.timing_json:
+        scl_perf.enable()
+    if args.quiet or args.verbose:
+        scl_log.set_level("quiet" if args.quiet else "debug")
+
+    scl_log.log.info("inpath: '%s'", inpath)
+
+    # walk once, classify archives, loose FCE and fedata files; skipped if
+    # both catalogs are reloaded as-is
+    tree = None
+    if (scl_dfutil.needs_scan(CONFIG["viv_archives_path"], CONFIG["opt_alwaysparseVIV"], CONFIG["opt_incrementalVIV"]) or
+        scl_dfutil.needs_scan(CONFIG["fce_archives_path"], CONFIG["opt_alwaysparseFCE"], CONFIG["opt_incrementalFCE"])):
+        tree = scl_libfceanalyze.walk_tree(inpath)
+
     # get BIGF/BIGH/BIG4 data
-    df_viv, FileNotFoundError_list, counter = scl_libvivanalyze.vivanalyze_main(CONFIG["viv_archives_path"], inpath, CONFIG["opt_alwaysparseVIV"])
+    df_viv, FileNotFoundError_list, counter = scl_libvivanalyze.vivanalyze_main(CONFIG["viv_archives_path"], inpath, CONFIG["opt_alwaysparseVIV"], args.jobs, CONFIG["opt_incrementalVIV"], lazy=True,
+                                                                                files=tree["files"] if tree is not None else None)
 
     # get FCE data
-    df_fce, df_fedata = scl_libfceanalyze.fceanalyze_main(inpath, df_viv, CONFIG["fce_archives_path"], CONFIG["opt_alwaysparseFCE"], CONFIG["opt_FCEondisk"])
+    df_fce, df_fedata = scl_libfceanalyze.fceanalyze_main(inpath, df_viv, CONFIG["fce_archives_path"], CONFIG["opt_alwaysparseFCE"], CONFIG["opt_FCEondisk"], args.jobs, args.header_only, CONFIG["opt_incrementalFCE"], tree,
+                                                          args.hash or args.sqlite is not None)
+
+    if args.sqlite:
+        scl_sqlcatalog.write_catalog(args.sqlite, df_viv, df_fce, df_fedata)
 
     # print
-    # scl_dfutil.printdf(df_fce)
-    print(df_fce)
-
-    if df_fedata is not None:
-        # df_fedata = df_fedata.unique()
-        # df_fedata = df_fedata.sort(["version", "car_name"])
-        df_fedata = df_fedata.drop(["colors"])
-        print(df_fedata)
-        # scl_dfutil.printdf(df_fedata)
+    if not args.quiet:
+        # scl_dfutil.printdf(df_fce)
+        print(df_fce)
+
+        if df_fedata is not None:
+            # df_fedata = df_fedata.unique()
+            # df_fedata = df_fedata.sort(["version", "car_name"])
+            df_fedata = df_fedata.drop(["colors"])
+            print(df_fedata)
+            # scl_dfutil.printdf(df_fedata)
+
+    if args.timing:
+        scl_perf.print_summary()
+    if args.timing_json:
+        scl_perf.write_json(args.timing_json)
 
 if __name__ == "__main__":
     # print(CONFIG)
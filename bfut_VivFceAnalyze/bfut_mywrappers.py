@@ -18,6 +18,8 @@
 """
     bfut_mywrappers.py - wrapping i/o functions etc.
 """
+import os
+
 import fcecodec as fc
 import numpy as np
 
@@ -57,6 +59,17 @@ def GetBufAt(path, start, end):
         buf = buf[start:end]
         return buf
 
+def GetBufRange(path, start, end):
+    """ Read only bytes [start:end], same result as GetBufAt() """
+    with open(path, "rb") as f:
+        end = min(end, os.fstat(f.fileno()).st_size)
+        if start >= end:
+            return b""
+        if hasattr(os, "pread"):
+            return os.pread(f.fileno(), end - start, start)
+        f.seek(start)
+        return f.read(end - start)
+
 def GetFceVersion(path):
     with open(path, "rb") as f:
         version = fc.GetFceVersion(f.read(0x2038))
@@ -38,34 +38,74 @@ import argparse
 import pathlib
 
 import scl_dfutil
+import scl_fsutil
+import scl_log
 import scl_libvivanalyze
+import scl_perf
+import scl_sqlcatalog
 
 CONFIG = {
     "opt_alwaysparseVIV" : 1  # if False, only parse VIV files if JSON does not exist
-    , "viv_archives_path" : "./viv_archives.json"
+    , "opt_incrementalVIV" : 0  # if True and JSON exists, only parse new or changed VIV files
+    , "viv_archives_path" : "./viv_archives.json"  # .json, .parquet, .arrow or .ndjson (streamed while scanning)
+    , "sqlite_path" : None  # if set, e.g. "./catalog.sqlite", also write archives and entries to indexed SQLite catalog
+    , "jobs" : 1  # worker processes for probing archives, 0 uses all cores
 }
 
 # Parse command (or print module help)
 parser = argparse.ArgumentParser()
 parser.add_argument("path", nargs="+", help="<path/to/folder>")
-args = parser.parse_args()
-inpath = pathlib.Path(args.path[0])
-
-print(f"inpath: '{inpath}'")
+parser.add_argument("-j", "--jobs", type=int, default=CONFIG["jobs"], help="worker processes for probing archives, 0 uses all cores")
+parser.add_argument("--include", action="append", default=[], help="only scan files matching glob (repeatable)")
+parser.add_argument("--exclude", action="append", default=[], help="skip files matching glob (repeatable)")
+parser.add_argument("--prune", action="append", default=[], help="skip directories matching glob, e.g. Backup (repeatable)")
+parser.add_argument("--one-file-system", action="store_true", help="do not descend into other filesystems")
+parser.add_argument("--readahead", type=int, default=scl_fsutil.CONFIG["readahead"], help="files hinted to the OS ahead of the reader (serial runs), 0 disables")
+verbosity = parser.add_mutually_exclusive_group()
+verbosity.add_argument("-q", "--quiet", action="store_true", help="print warnings and errors only")
+verbosity.add_argument("-v", "--verbose", action="store_true", help="print every file and FCE entry")
+parser.add_argument("--sqlite", default=CONFIG["sqlite_path"], help="also write SQLite catalog to file, query with bfut_vivfcequery.py")
+parser.add_argument("--timing", action="store_true", help="print per-stage timing summary")
+parser.add_argument("--timing-json", help="write per-stage timing summary to JSON file")
 
 def main():
+    args = parser.parse_args()
+    inpath = pathlib.Path(args.path[0])
+    scl_fsutil.CONFIG.update({
+        "include": args.include,
+        "exclude": args.exclude,
+        "prune": args.prune,
+        "same_device": args.one_file_system,
+        "readahead": args.readahead,
+    })
+    if args.timing or args.timing_json:
+        scl_perf.enable()
+    if args.quiet or args.verbose:
+        scl_log.set_level("quiet" if args.quiet else "debug")
+
+    scl_log.log.info("inpath: '%s'", inpath)
+
     # get BIGF/BIGH/BIG4 data
-    df_viv, FileNotFoundError_list, counter = scl_libvivanalyze.vivanalyze_main(CONFIG["viv_archives_path"], inpath, CONFIG["opt_alwaysparseVIV"])
+    df_viv, FileNotFoundError_list, counter = scl_libvivanalyze.vivanalyze_main(CONFIG["viv_archives_path"], inpath, CONFIG["opt_alwaysparseVIV"], args.jobs, CONFIG["opt_incrementalVIV"])
+
+    if args.sqlite:
+        scl_sqlcatalog.write_catalog(args.sqlite, df_viv)
 
     # print
     # df_viv = df_viv.select(
     #     ['path', 'format', 'size_true', 'files', 'files_offsets', 'files_sizes', 'files_fn_lens', 'files_fn_ofs']
     # )
     # scl_dfutil.printdf(df_viv)
-    print(df_viv)
-    print(f"df_viv.columns: {df_viv.columns}")
-    print(f"FileNotFoundError_list: {FileNotFoundError_list}")
-    print(f"counter: {counter}")
+    if not args.quiet:
+        print(df_viv)
+        print(f"df_viv.columns: {df_viv.columns}")
+        print(f"FileNotFoundError_list: {FileNotFoundError_list}")
+        print(f"counter: {counter}")
+
+    if args.timing:
+        scl_perf.print_summary()
+    if args.timing_json:
+        scl_perf.write_json(args.timing_json)
 
 if __name__ == "__main__":
     # print(CONFIG)
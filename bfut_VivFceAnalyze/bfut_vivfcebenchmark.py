@@ -0,0 +1,123 @@
+# Copyright (C) 2024 and later Benjamin Futasz <https://github.com/bfut>
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the authors be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+"""
+bfut_vivfcebenchmark.py - benchmark bfut_vivanalyze / bfut_fceanalyze on a synthetic corpus
+
+USAGE
+    Generate corpus (if missing or parameters changed) in /path/to/corpus, run pipeline, print files/s, MB/s, peak RSS and per-stage timings:
+        python "bfut_vivfcebenchmark.py" /path/to/corpus
+
+    Larger corpus, 4 worker processes, 3 runs, write results to JSON:
+        python "bfut_vivfcebenchmark.py" /path/to/corpus --archives 2000 --loose-fce 500 -j 4 --repeat 3 --json bench.json
+
+INSTALLATION
+    Requires Python 3.10 or later.
+
+    python -m pip install -U fcecodec unvivtool polars
+
+HOMEPAGE
+    https://github.com/bfut/PyScripts
+"""
+
+import argparse
+import json
+import pathlib
+import time
+
+import polars as pl
+
+import scl_benchmark
+import scl_fsutil
+import scl_log
+import scl_perf
+
+# Parse command (or print module help)
+parser = argparse.ArgumentParser()
+parser.add_argument("path", nargs="+", help="<path/to/corpus>, created if missing")
+parser.add_argument("--archives", type=int, default=scl_benchmark.CONFIG["archives"], help="VIV archives")
+parser.add_argument("--fce-per-archive", type=int, default=scl_benchmark.CONFIG["fce_per_archive"], help="FCE entries per archive")
+parser.add_argument("--loose-fce", type=int, default=scl_benchmark.CONFIG["loose_fce"], help="FCE files on disk")
+parser.add_argument("--other-files", type=int, default=scl_benchmark.CONFIG["other_files"], help="files that are not archives")
+parser.add_argument("--other-size", type=int, default=scl_benchmark.CONFIG["other_size"], help="bytes per other file")
+parser.add_argument("--parts", type=int, default=scl_benchmark.CONFIG["parts"], help="parts per FCE")
+parser.add_argument("--verts-per-part", type=int, default=scl_benchmark.CONFIG["verts_per_part"], help="vertices and triangles per part")
+parser.add_argument("--seed", type=int, default=scl_benchmark.CONFIG["seed"])
+parser.add_argument("--force", action="store_true", help="regenerate corpus")
+parser.add_argument("--generate-only", action="store_true", help="generate corpus, skip benchmark")
+parser.add_argument("--header-only", action="store_true", help="read FCE headers only, skip mesh decoding")
+parser.add_argument("--hash", action="store_true", help="hash FCE data, as with a SQLite catalog")
+parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes, 0 uses all cores")
+parser.add_argument("--readahead", type=int, default=scl_fsutil.CONFIG["readahead"], help="tasks whose reads are hinted ahead (serial runs), 0 disables")
+parser.add_argument("--cold", action="store_true", help="evict corpus from page cache before each run")
+parser.add_argument("--repeat", type=int, default=1, help="runs, the fastest is reported")
+parser.add_argument("--json", help="write results to JSON file")
+
+def main():
+    args = parser.parse_args()
+    inpath = pathlib.Path(args.path[0])
+    scl_fsutil.CONFIG["readahead"] = args.readahead
+    scl_log.set_level("quiet")
+
+    t0 = time.perf_counter()
+    params = scl_benchmark.make_corpus(inpath, args.force,
+                                       archives=args.archives, fce_per_archive=args.fce_per_archive, loose_fce=args.loose_fce,
+                                       other_files=args.other_files, other_size=args.other_size,
+                                       parts=args.parts, verts_per_part=args.verts_per_part, seed=args.seed)
+    print(f"corpus: '{inpath}' {params} ({time.perf_counter() - t0:.3f} s)")
+    if args.generate_only:
+        return
+
+    scl_perf.enable()
+    runs = []
+    for i in range(max(1, args.repeat)):
+        scl_perf.reset()
+        if args.cold and not scl_benchmark.drop_page_cache(inpath):
+            print("Warning: cannot evict page cache on this platform, run is warm")
+        df, stats = scl_benchmark.run_benchmark(inpath, args.jobs, args.header_only, args.hash)
+        runs.append((df, stats, scl_perf.snapshot()))
+        print(f"run {i}: {stats['wall']:.3f} s")
+
+    # report fastest run
+    df, stats, stages = min(runs, key=lambda run: run[1]["wall"])
+    scl_perf.reset()
+    scl_perf.merge(stages)
+    with pl.Config(tbl_rows=-1, tbl_cols=-1, float_precision=3):
+        print(df)
+    scl_perf.print_summary(stats["wall"])
+    line = f"files/s: {stats['files_per_s']:.1f}, FCE MB/s: {stats['MB_per_s']:.1f}"
+    if stats["peak_rss_MB"] is not None:
+        line += f", peak RSS: {stats['peak_rss_MB']:.1f} MB (workers: {stats['peak_rss_children_MB']:.1f} MB)"
+    print(line)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "corpus": params,
+                "jobs": args.jobs,
+                "header_only": args.header_only,
+                "hash": args.hash,
+                "readahead": args.readahead,
+                "cold": args.cold,
+                "walls": [run[1]["wall"] for run in runs],
+                "totals": stats,
+                "phases": df.to_dicts(),
+                "stages": scl_perf.summary(stats["wall"]).to_dicts(),
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Copyright (C) 2024 and later Benjamin Futasz <https://github.com/bfut>
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the authors be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+"""
+bfut_vivfcequery.py - look up archives, FCE files, parts and cars in a SQLite catalog
+
+USAGE
+    Write SQLite catalog while scanning:
+        python "bfut_fceanalyze.py" /path/to/directory --sqlite catalog.sqlite
+
+    Archives with a part named :HB with more than 5000 triangles:
+        python "bfut_vivfcequery.py" catalog.sqlite part :HB --min-triags 5000 --archives
+
+    Other lookups:
+        python "bfut_vivfcequery.py" catalog.sqlite car "%diablo%"
+        python "bfut_vivfcequery.py" catalog.sqlite entry car.fce
+        python "bfut_vivfcequery.py" catalog.sqlite hash <hash>
+        python "bfut_vivfcequery.py" catalog.sqlite dupes
+        python "bfut_vivfcequery.py" catalog.sqlite sql "SELECT path, MNumTriags FROM meshes ORDER BY MNumTriags DESC LIMIT 10"
+        python "bfut_vivfcequery.py" catalog.sqlite summary
+
+INSTALLATION
+    Requires Python 3.10 or later.
+
+    python -m pip install -U fcecodec unvivtool polars
+
+HOMEPAGE
+    https://github.com/bfut/PyScripts
+"""
+
+import argparse
+import contextlib
+import pathlib
+import sys
+import time
+
+import polars as pl
+
+import scl_sqlcatalog
+
+# Parse command (or print module help)
+parser = argparse.ArgumentParser()
+parser.add_argument("path", help="<path/to/catalog.sqlite>")
+output = argparse.ArgumentParser(add_help=False)
+output.add_argument("-n", "--rows", type=int, default=50, help="rows to print, -1 prints all")
+output.add_argument("--csv", action="store_true", help="print CSV instead of table")
+subparsers = parser.add_subparsers(dest="command", required=True)
+p = subparsers.add_parser("part", parents=[output], help="FCE files with a part of this name")
+p.add_argument("name", help="part name, e.g. :HB")
+p.add_argument("--min-triags", type=int, help="only parts with more triangles")
+p.add_argument("--archives", action="store_true", help="list matching archive / file paths only")
+p = subparsers.add_parser("car", parents=[output], help="FCE files by car name (LIKE pattern, case-insensitive)")
+p.add_argument("pattern", help="e.g. %%diablo%%")
+p = subparsers.add_parser("entry", parents=[output], help="archives containing an entry of this name")
+p.add_argument("name", help="e.g. car.fce")
+p = subparsers.add_parser("hash", parents=[output], help="all copies of an FCE by content hash")
+p.add_argument("hash")
+p = subparsers.add_parser("dupes", parents=[output], help="FCE content hashes with several copies")
+p.add_argument("--min-count", type=int, default=2)
+p = subparsers.add_parser("sql", parents=[output], help="run SQL statement")
+p.add_argument("statement")
+subparsers.add_parser("summary", parents=[output], help="rows per table")
+
+def main():
+    args = parser.parse_args()
+    if not pathlib.Path(args.path).is_file():
+        print(f"Error: catalog '{args.path}' not found", file=sys.stderr)
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    with contextlib.closing(scl_sqlcatalog.connect(args.path, readonly=True)) as con:
+        if args.command == "part":
+            df = scl_sqlcatalog.find_parts(con, args.name, args.min_triags)
+            if args.archives:
+                df = df.select("path", "archive_format").unique(maintain_order=True)
+        elif args.command == "car":
+            df = scl_sqlcatalog.find_cars(con, args.pattern)
+        elif args.command == "entry":
+            df = scl_sqlcatalog.find_entries(con, args.name)
+        elif args.command == "hash":
+            df = scl_sqlcatalog.find_hash(con, args.hash)
+        elif args.command == "dupes":
+            df = scl_sqlcatalog.find_duplicates(con, args.min_count)
+        elif args.command == "sql":
+            df = scl_sqlcatalog.query(con, args.statement)
+        else:
+            df = scl_sqlcatalog.summary(con)
+    dt = time.perf_counter() - t0
+
+    if args.csv:
+        print(df.write_csv(), end="")
+        return
+    with pl.Config(tbl_rows=args.rows, tbl_cols=-1, fmt_str_lengths=200, tbl_width_chars=250):
+        print(df)
+    print(f"{df.height} rows ({dt * 1000:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
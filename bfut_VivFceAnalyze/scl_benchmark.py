@@ -0,0 +1,310 @@
+# Copyright (C) 2024 and later Benjamin Futasz <https://github.com/bfut>
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the authors be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+"""
+scl_benchmark.py - Python library
+
+Deterministic synthetic corpus and benchmark of the VIV/FCE pipeline.
+
+    make_corpus("path/to/corpus", archives=200)
+    df, stats = run_benchmark("path/to/corpus", jobs=1)
+
+Corpus layout:
+    cars/NNNNN/car.viv     FCE entries, fedata.eng, car.txt
+    loose/NNNNN/car.fce    FCE on disk, next to FEDATA.ENG
+    misc/NNNNN.bin         other files, not archives
+    corpus.json            generator parameters
+
+Archives cycle through FCE3, FCE4 and FCE4M and through the BIGF, BIGH
+and BIG4 formats. Every FCE is unique, so deduplication does not
+skew decode timings. Files are read warm from the page cache after
+generation, unless evicted with drop_page_cache().
+
+The corpus holds no RefPack archives; make_corpus() checks
+scl_refpack.refpack_decompress() on a fixed sample stream instead.
+
+HOMEPAGE
+    https://github.com/bfut/PyScripts
+"""
+
+import contextlib
+import json
+import os
+import pathlib
+import struct
+import sys
+import tempfile
+import time
+
+import fcecodec as fc
+import numpy as np
+import polars as pl
+import unvivtool as uvt
+
+import scl_fsutil
+import scl_libfceanalyze
+import scl_libvivanalyze
+import scl_refpack
+
+CONFIG = {
+    "archives" : 200  # VIV archives
+    , "fce_per_archive" : 2  # FCE entries per archive
+    , "loose_fce" : 50  # FCE files on disk
+    , "other_files" : 100  # files that are not archives
+    , "other_size" : 64 * 1024  # bytes per other file
+    , "parts" : 8  # parts per FCE
+    , "verts_per_part" : 200  # vertices (and triangles) per part
+    , "seed" : 0
+}
+
+viv_formats = ["BIGF", "BIGH", "BIG4"]
+fce_versions = [3, 4, 5]  # FCE3, FCE4, FCE4M
+
+# RefPack sample, one command of each kind; headers without and with the
+# compressed size field and with 4-byte size fields
+refpack_sample_body = (
+    b"\xE0abcd"  # 4 literals
+    + b"\x00\x03"  # copy 3 from offset 4
+    + b"\x81\x40\x06x"  # 1 literal, copy 5 from offset 7
+    + b"\xC2\x00\x0C\x01yz"  # 2 literals, copy 6 from offset 13
+    + b"\xFDw"  # 1 literal, stop
+)
+refpack_sample_headers = [b"\x10\xFB\x00\x00\x16", b"\x11\xFB\x00\x00\x1B\x00\x00\x16", b"\x90\xFB\x00\x00\x00\x16"]
+refpack_sample_data = b"abcdabcxbcdabyzcdabcxw"
+
+
+# corpus
+@contextlib.contextmanager
+def suppress_stdout():
+    """ Silence C-level stdout, e.g., unvivtool progress output """
+    sys.stdout.flush()
+    fd = os.dup(1)
+    try:
+        with open(os.devnull, "w") as devnull:
+            os.dup2(devnull.fileno(), 1)
+        yield
+    finally:
+        os.dup2(fd, 1)
+        os.close(fd)
+
+def make_mesh(rs: np.random.RandomState, parts: int, verts_per_part: int):
+    mesh = fc.Mesh()
+    for p in range(parts):
+        nv = verts_per_part
+        vert_idxs = rs.randint(0, nv, 3 * nv).astype(np.int32)
+        texcoords = rs.rand(6 * nv).astype(np.float32)
+        pos = (rs.rand(3 * nv) - 0.5).astype(np.float32)
+        normals = rs.randn(nv, 3)
+        normals = (normals / np.linalg.norm(normals, axis=1, keepdims=True)).astype(np.float32).flatten()
+        pid = mesh.IoGeomDataToNewPart(vert_idxs, texcoords, pos, normals)
+        mesh.PSetName(pid, f":Part{p:02}")
+        mesh.PSetPos(pid, (rs.rand(3) - 0.5).astype(np.float32))
+    ncolors = rs.randint(1, 5)
+    mesh.MSetColors(rs.randint(0, 256, (ncolors, 4, 4)).astype(np.uint8))
+    ndummies = rs.randint(1, 5)
+    mesh.MSetDummyNames([f"DUMMY{i:02}" for i in range(ndummies)])
+    mesh.MSetDummyPos((rs.rand(3 * ndummies) - 0.5).astype(np.float32))
+    return mesh
+
+def encode_fce(mesh, version: int):
+    if version == 3:
+        return mesh.IoEncode_Fce3(False)
+    if version == 4:
+        return mesh.IoEncode_Fce4(False)
+    return mesh.IoEncode_Fce4M(False)
+
+def _put_string(buf: bytearray, ofs_ptr: int, fpos: int, s: str):
+    """ Write pointer at ofs_ptr, null-terminated s at fpos. Return next free position """
+    data = s.encode("windows-1252") + b"\x00"
+    buf[ofs_ptr:ofs_ptr+4] = struct.pack("<I", fpos)
+    buf[fpos:fpos+len(data)] = data
+    return fpos + len(data)
+
+def make_fedata(version: int, i: int):
+    """ Return fedata buffer readable by scl_libfedata.FEData, version 3 or 4 """
+    if version == 3:
+        buf = bytearray(0x200)
+        buf[0x0:0x4] = f"c{i % 1000:03}".encode("ascii")
+        buf[0x4:0x6] = b"\x09\x00"
+        buf[0xA:0xC] = struct.pack("<H", i % 3)
+        buf[0x18:0x1A] = struct.pack("<H", i % 0x10000)
+        fpos = 0x100
+        ptrs = [0x2F, 0x33, 0x37]
+        colors = [0xA7, 0xAB, 0xAF, 0xB3, 0xB7, 0xBB, 0xBF, 0xC3, 0xC7, 0xCB]
+    else:
+        buf = bytearray(0x600)
+        buf[0x0:0x2] = b"\x04\x00"
+        buf[0x112:0x116] = f"c{i % 1000:03}".encode("ascii")
+        buf[0x31E:0x322] = struct.pack("<I", i)
+        buf[0x382:0x386] = struct.pack("<I", i % 4)
+        buf[0x37A:0x37C] = struct.pack("<H", 0x0013)
+        fpos = 0x470
+        ptrs = [0x3C0, 0x3C4, 0x3C8]
+        colors = [0x43C, 0x440, 0x444, 0x448, 0x44C, 0x450, 0x454, 0x458, 0x45C, 0x460]
+    for ofs_ptr, s in zip(ptrs, [f"Maker{i % 17}", f"Model{i}", f"Car {i}"]):
+        fpos = _put_string(buf, ofs_ptr, fpos, s)
+    for k, ofs_ptr in enumerate(colors):
+        fpos = _put_string(buf, ofs_ptr, fpos, f"Color{k}")
+    return bytes(buf)
+
+def check_refpack():
+    """ Round-trip check of scl_refpack.refpack_decompress() on the RefPack sample """
+    for header in refpack_sample_headers:
+        if scl_refpack.refpack_decompress(header + refpack_sample_body) != refpack_sample_data:
+            raise RuntimeError(f"refpack_decompress() failed on sample with header {header.hex()}")
+
+def make_corpus(outpath: pathlib.Path, force: bool = False, **params):
+    """
+    Write corpus to outpath, parameters default to CONFIG. Same parameters
+    give byte-identical files. An existing corpus with the same parameters is
+    kept unless force. Return parameters.
+    """
+    params = {k: params.get(k, v) for k, v in CONFIG.items()}
+    outpath = pathlib.Path(outpath)
+    check_refpack()
+    path_manifest = outpath / "corpus.json"
+    if not force and path_manifest.is_file():
+        with open(path_manifest, encoding="utf-8") as f:
+            if json.load(f) == params:
+                return params
+
+    rs = np.random.RandomState(params["seed"])
+    outpath.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = pathlib.Path(tmpdir)
+        for i in range(params["archives"]):
+            version = fce_versions[i % len(fce_versions)]
+            infiles = []
+            for k in range(params["fce_per_archive"]):
+                p = tmpdir / ("car.fce" if k == 0 else f"part{k}.fce")
+                p.write_bytes(encode_fce(make_mesh(rs, params["parts"], params["verts_per_part"]), version))
+                infiles.append(p)
+            p = tmpdir / "fedata.eng"
+            p.write_bytes(make_fedata(min(version, 4), i))
+            infiles.append(p)
+            p = tmpdir / "car.txt"
+            p.write_bytes(f"car {i}\n".encode("ascii"))
+            infiles.append(p)
+
+            dirpath = outpath / "cars" / f"{i:05}"
+            dirpath.mkdir(parents=True, exist_ok=True)
+            vivpath = dirpath / "car.viv"
+            vivpath.unlink(missing_ok=True)
+            with suppress_stdout():
+                uvt.viv(str(vivpath), [str(p) for p in infiles], format=viv_formats[i % len(viv_formats)])
+            for p in infiles:
+                p.unlink()
+
+    for i in range(params["loose_fce"]):
+        version = fce_versions[i % len(fce_versions)]
+        dirpath = outpath / "loose" / f"{i:05}"
+        dirpath.mkdir(parents=True, exist_ok=True)
+        (dirpath / "car.fce").write_bytes(encode_fce(make_mesh(rs, params["parts"], params["verts_per_part"]), version))
+        (dirpath / "FEDATA.ENG").write_bytes(make_fedata(min(version, 4), i))
+
+    dirpath = outpath / "misc"
+    dirpath.mkdir(parents=True, exist_ok=True)
+    for i in range(params["other_files"]):
+        (dirpath / f"{i:05}.bin").write_bytes(rs.bytes(params["other_size"]))
+
+    with open(path_manifest, "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+    return params
+
+
+# benchmark
+def drop_page_cache(inpath: pathlib.Path):
+    """
+    Evict corpus files from the page cache with
+    posix_fadvise(POSIX_FADV_DONTNEED), for cold-cache runs. Needs no
+    privileges, but is advisory. Return False if not supported.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for entry in scl_fsutil.walk_files(inpath):
+        fd = os.open(entry.path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+def get_peak_rss():
+    """
+    Return peak resident set size in bytes of (this process, waited-for
+    children), (None, None) where the resource module is missing (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is KiB on Linux
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+def run_benchmark(inpath: pathlib.Path, jobs: int = 1, header_only: bool = False, opt_hash: bool = False):
+    """
+    Run the full pipeline once on inpath: walk, viv_analyze(), fce_analyze().
+    Return (pl.DataFrame with one row per phase, dict of totals). Stage
+    timings are recorded in scl_perf if enabled.
+
+    Phases: walk (files), viv (files probed), fce (FCE entries decoded);
+    MB is the FCE data read by the fce phase (headers only if header_only).
+    walk and viv read no file data in bulk, their MB is None.
+    """
+    inpath = pathlib.Path(inpath)
+    rows = []
+
+    t0 = time.perf_counter()
+    tree = scl_libfceanalyze.walk_tree(inpath)
+    t1 = time.perf_counter()
+    rows.append(("walk", t1 - t0, len(tree["files"]), None))
+
+    df_viv, _, _ = scl_libvivanalyze.viv_analyze(inpath, jobs, files=tree["files"])
+    t2 = time.perf_counter()
+    rows.append(("viv", t2 - t1, len(tree["files"]), None))
+
+    df_fce, FileNotFoundError_list, _ = scl_libfceanalyze.fce_analyze(df_viv, True, inpath, jobs, header_only, tree=tree, opt_hash=opt_hash)
+    t3 = time.perf_counter()
+    nbytes_fce = 0
+    if len(df_fce) > 0:
+        sizes = df_fce["size"] - df_fce["offset"]
+        nbytes_fce = (sizes.clip(upper_bound=scl_libfceanalyze.fce_header_size) if header_only else sizes).sum()
+    rows.append(("fce", t3 - t2, len(df_fce), nbytes_fce))
+    rows.append(("total", t3 - t0, len(tree["files"]), nbytes_fce))
+
+    df = pl.DataFrame(rows, schema={"phase": str, "seconds": float, "count": int, "nbytes": int}, orient="row").with_columns(
+        MB=pl.col("nbytes") / 1e6,
+    ).with_columns(
+        count_per_s=pl.col("count") / pl.col("seconds"),
+        MB_per_s=pl.when(pl.col("nbytes") > 0).then(pl.col("MB") / pl.col("seconds")),
+    ).drop("nbytes")
+
+    peak_rss, peak_rss_children = get_peak_rss()
+    stats = {
+        "wall": t3 - t0,
+        "files": len(tree["files"]),
+        "archives": len(df_viv),
+        "fce_entries": len(df_fce),
+        "fce_errors": len(FileNotFoundError_list),
+        "MB": nbytes_fce / 1e6,
+        "files_per_s": len(tree["files"]) / (t3 - t0),
+        "MB_per_s": nbytes_fce / 1e6 / (t3 - t0),
+        "peak_rss_MB": peak_rss / 1e6 if peak_rss is not None else None,
+        "peak_rss_children_MB": peak_rss_children / 1e6 if peak_rss_children is not None else None,
+    }
+    return df, stats
@@ -19,10 +19,13 @@
 scl_dfutil.py - Python library
 """
 
+import json
 import pathlib
 
 import polars as pl
 
+import scl_perf
+
 # util
 def printdf(df: pl.DataFrame | pl.LazyFrame | pl.Series):
     if not isinstance(df, (pl.DataFrame, pl.LazyFrame, pl.Series)):
@@ -42,6 +45,82 @@ def writejson(df: pl.DataFrame | pl.LazyFrame, path: pathlib.Path):
     # )
     df.write_json(path)
 
+def get_format(path: pathlib.Path):
+    """
+    Return catalog format from file extension: "parquet", "ipc", "ndjson" or "json".
+    """
+    suffix = pathlib.Path(path).suffix.lower()
+    if suffix in [".ndjson", ".jsonl"]:
+        return "ndjson"
+    if suffix == ".parquet":
+        return "parquet"
+    if suffix in [".arrow", ".ipc", ".feather"]:
+        return "ipc"
+    return "json"
+
+def needs_scan(path: pathlib.Path, opt_alwaysparse: bool, opt_incremental: bool):
+    """
+    Return True if the catalog at path is (re)built by scanning, False if it
+    is reloaded as-is. Same rule for the VIV and FCE catalogs.
+    """
+    return not pathlib.Path(path).exists() or bool(opt_alwaysparse) or bool(opt_incremental)
+
+def writedf(df: pl.DataFrame | pl.LazyFrame, path: pathlib.Path):
+    """
+    Write catalog to disk. Format is selected by file extension, see get_format().
+    """
+    with scl_perf.stage("write_catalog"):
+        if isinstance(df, pl.LazyFrame):
+            df = df.collect()
+        fmt = get_format(path)
+        if fmt == "parquet":
+            df.write_parquet(path)
+        elif fmt == "ipc":
+            df.write_ipc(path)
+        elif fmt == "ndjson":
+            df.write_ndjson(path)
+        else:
+            writejson(df, path)
+
+def readdf(path: pathlib.Path, schema: dict = None):
+    with scl_perf.stage("read_catalog"):
+        return scandf(path, schema).collect()
+
+def scandf(path: pathlib.Path, schema: dict = None):
+    """
+    Return catalog as LazyFrame. Parquet, Arrow IPC and NDJSON are scanned
+    lazily, so filters and column selections are pushed down into the reader.
+    JSON is read completely.
+
+    schema: NDJSON only, skips schema inference
+    """
+    fmt = get_format(path)
+    if fmt == "parquet":
+        return pl.scan_parquet(path)
+    if fmt == "ipc":
+        return pl.scan_ipc(path)
+    if fmt == "ndjson":
+        if schema is not None:
+            schema = pl.Schema(schema)  # resolve Python types, e.g., str, int
+        return pl.scan_ndjson(path, schema=schema)
+    return pl.read_json(path).lazy()
+
+def appendndjson(row: dict, f):
+    """
+    Append row to open NDJSON file and flush, so the record survives a crash.
+    """
+    f.write(json.dumps(row) + "\n")
+    f.flush()
+
+def repairndjson(path: pathlib.Path):
+    """
+    Truncate incomplete last line, e.g., left by an interrupted write.
+    """
+    with open(path, "rb+") as f:
+        buf = f.read()
+        if len(buf) > 0 and not buf.endswith(b"\n"):
+            f.truncate(buf.rfind(b"\n") + 1)
+
 def byteslist2hex(l: list[bytes]):
     if isinstance(l, list):
         return [b.hex() for b in l]
@@ -0,0 +1,205 @@
+# Copyright (C) 2024 and later Benjamin Futasz <https://github.com/bfut>
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the authors be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+"""
+scl_fsutil.py - Python library
+
+HOMEPAGE
+    https://github.com/bfut/PyScripts
+"""
+
+import collections
+import fnmatch
+import os
+import pathlib
+import queue
+import threading
+
+import scl_perf
+
+CONFIG = {
+    "include" : []  # file name globs, e.g. ["*.viv"]; if empty, include all
+    , "exclude" : []  # file name globs, e.g. ["*.bak"]
+    , "prune" : []  # directory name globs, e.g. ["Backup", ".git"]
+    , "same_device" : False  # if True, do not descend into other filesystems
+    , "readahead" : 8  # tasks whose reads are hinted ahead of the reader, 0 disables
+    , "readahead_threads" : 4  # I/O threads issuing hints
+    , "readahead_header" : 64 * 1024  # bytes hinted per file when only its header is read
+    , "readahead_magic" : 4096  # bytes hinted per file when only its magic bytes are read, one page
+}
+
+def _match(name: str, patterns: list):
+    name = name.lower()
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(name, pattern.lower()):
+            return True
+    return False
+
+def get_dev(entry: os.DirEntry):
+    """ st_dev of entry, not following symlinks; DirEntry.stat() reports 0 on Windows """
+    if os.name == "nt":
+        return os.stat(entry.path, follow_symlinks=False).st_dev
+    return entry.stat(follow_symlinks=False).st_dev
+
+def scan_dir(top: str, include: list = None, exclude: list = None, prune: list = None, same_device: bool = None, root_dev: int = None):
+    """
+    List one directory with the filters of walk_files(). Returns (files,
+    subdirs): os.DirEntry list of files and list of subdirectory paths, both
+    in scandir order.
+
+    root_dev: device of the walk root; if None and same_device, the device of
+        top is used
+    """
+    include = CONFIG["include"] if include is None else include
+    exclude = CONFIG["exclude"] if exclude is None else exclude
+    prune = CONFIG["prune"] if prune is None else prune
+    same_device = CONFIG["same_device"] if same_device is None else same_device
+    if same_device and root_dev is None:
+        root_dev = os.stat(top).st_dev
+
+    files = []
+    subdirs = []
+    st = scl_perf.stage("walk")
+    try:
+        with st, os.scandir(top) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if entry.is_symlink():  # as os.walk(followlinks=False)
+                        continue
+                    if prune and _match(entry.name, prune):
+                        continue
+                    if same_device and get_dev(entry) != root_dev:
+                        continue
+                    subdirs.append(entry.path)
+                    continue
+                if not entry.name.isprintable():
+                    continue
+                if include and not _match(entry.name, include):
+                    continue
+                if exclude and _match(entry.name, exclude):
+                    continue
+                files.append(entry)
+            st.count = len(files)
+    except OSError:
+        pass
+    return files, subdirs
+
+def walk_files(inpath: pathlib.Path, include: list = None, exclude: list = None, prune: list = None, same_device: bool = None):
+    """
+    Yield os.DirEntry for every file in inpath, recursively.
+
+    Same order as os.walk() top-down. Skips non-printable file names. Globs
+    are matched against names, not case-sensitive. Arguments left None are
+    taken from CONFIG. DirEntry.stat() results are cached, so callers should
+    use entry.stat() instead of stat'ing the path again.
+    """
+    same_device = CONFIG["same_device"] if same_device is None else same_device
+
+    root_dev = None
+    if same_device:
+        root_dev = os.stat(inpath).st_dev
+
+    stack = [os.fspath(inpath)]
+    while stack:
+        files, subdirs = scan_dir(stack.pop(), include, exclude, prune, same_device, root_dev)
+        yield from files
+        stack.extend(reversed(subdirs))
+
+
+# read-ahead
+def will_need(path, ranges: list = None):
+    """
+    Ask the OS to load ranges [(start, end), ...] of path into the page cache,
+    whole file if ranges is None. Uses posix_fadvise(POSIX_FADV_WILLNEED)
+    where available, otherwise reads the ranges. Errors are ignored, the
+    actual reader reports them.
+    """
+    if ranges is None:
+        ranges = [(0, 0)]  # length 0: to end of file
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    except OSError:
+        return
+    try:
+        for start, end in ranges:
+            length = max(0, end - start)
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, start, length, os.POSIX_FADV_WILLNEED)
+                continue
+            os.lseek(fd, start, os.SEEK_SET)
+            remaining = length if length > 0 else -1
+            while remaining != 0:
+                n = 1 << 20 if remaining < 0 else min(1 << 20, remaining)
+                buf = os.read(fd, n)
+                if not buf:
+                    break
+                remaining = remaining - len(buf) if remaining > 0 else -1
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def readahead(items, get_hints, depth: int = None, threads: int = None):
+    """
+    Yield items in order. Up to depth items ahead of the consumer,
+    get_hints(item) -> [(path, ranges), ...] is passed to will_need() on I/O
+    threads, so reads of upcoming items overlap parsing of the current one.
+    Hints for items the consumer has reached already are skipped. Arguments
+    left None are taken from CONFIG; depth < 1 yields items as is.
+    """
+    depth = CONFIG["readahead"] if depth is None else depth
+    threads = CONFIG["readahead_threads"] if threads is None else threads
+    if depth < 1:
+        yield from items
+        return
+    q = queue.SimpleQueue()  # (item index, hints)
+    pos = [0]  # index of the item the consumer is at
+
+    def worker():
+        while True:
+            task = q.get()
+            if task is None:
+                return
+            i, hints = task
+            if i > pos[0]:
+                for path, ranges in hints:
+                    will_need(path, ranges)
+
+    workers = [threading.Thread(target=worker, name="readahead", daemon=True) for _ in range(max(1, threads))]
+    for t in workers:
+        t.start()
+    pending = collections.deque()
+    try:
+        for i, item in enumerate(items):
+            q.put((i, get_hints(item)))
+            pending.append((i, item))
+            if len(pending) > depth:
+                pos[0], item = pending.popleft()
+                yield item
+        while pending:
+            pos[0], item = pending.popleft()
+            yield item
+    finally:
+        pos[0] = float("inf")
+        for t in workers:
+            q.put(None)
+        for t in workers:
+            t.join()
@@ -22,15 +22,28 @@ HOMEPAGE
     https://github.com/bfut/PyScripts
 """
 
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
 import os
 import pathlib
+import queue
+import struct
+import threading
 
 import fcecodec as fc
 import numpy as np
 import polars as pl
 
 import scl_dfutil
+import scl_fsutil
 import scl_libfedata
+import scl_libvivanalyze
+import scl_log
+import scl_perf
+import scl_pool
+import scl_refpack
 from bfut_mywrappers import *
 
 CONFIG = {
@@ -42,26 +55,89 @@ if fc.__version__ < min_fcecodec_version:
     print(f"Error: fcecodec version {fc.__version__} is less than {min_fcecodec_version}. Please install latest fcecodec version.")
     raise ImportError
 
+fce_schema = {
+    "car_name": str,
+    "path": str,
+    "format": str,
+    "offset": int,
+    "size": int,
+    "mtime_ns": int,  # of file at path
+    "hash": str,  # BLAKE2b-128 hex digest of FCE data, None unless fce_analyze(opt_hash=True)
+    "header_only": bool,  # mesh columns read from FCE header only
+    "fedata_path": str,  # loose fedata.* file of an FCE file on disk, None for archive entries
+    "fedata_mtime_ns": int,  # of file at fedata_path
+
+    "name": str,
+    "version": int,
+    "MNumParts": int,
+    "MNumTriags": int,
+    "MNumVerts": int,
+    "MNumArts": int,
+    "MUnknown3": int,
+
+    "NumColors": int,
+    "MGetColors": pl.List(int),
+
+    "NumDummies": int,
+    "MGetDummyNames": pl.List(str),
+    "MGetDummyPos": pl.List(float),
+
+    "PGetName": pl.List(str),
+    "PGetPos": pl.List(float),
+    "PNumTriags": pl.List(int),
+    "PNumVerts": pl.List(int),
+}
+
 
 def find_path_from_list(folder: pathlib.Path, flist: list):
     """
     Find a file in a folder from a list of files. Return the path of the first file found.
 
-    Not case-sensitive.
+    Not case-sensitive. Searches subfolders in walk order. Lists folders on
+    each call; to resolve many files, see index_fedata().
     """
     inpath_ = pathlib.Path(folder)
     if inpath_.is_dir():
-        for subdir, dirs, files in os.walk(inpath_):
-            for file in files:
-                b = str(file).isprintable()
-                if not b:
-                    continue
-                filepath = (pathlib.Path(subdir) / file)
-
-                if pathlib.Path(filepath.name).as_posix().lower() in flist:
-                    return filepath
+        for entry in scl_fsutil.walk_files(inpath_):
+            if entry.name.lower() in flist:
+                return pathlib.Path(entry.path)
     return None
 
+def walk_tree(inpath: pathlib.Path):
+    """
+    Walk inpath once and classify files for the VIV and FCE stages. Returns
+    dict of os.DirEntry lists, walk order:
+        "files": all files (VIV archive candidates, see viv_analyze())
+        "fce": loose FCE files
+        "fedata": loose fedata.* files
+    """
+    tree = {"files": [], "fce": [], "fedata": []}
+    if pathlib.Path(inpath).is_dir():
+        for entry in scl_fsutil.walk_files(inpath):
+            tree["files"].append(entry)
+            name = entry.name.lower()
+            if os.path.splitext(name)[1] == ".fce":
+                tree["fce"].append(entry)
+            elif name in fedata_flist:
+                tree["fedata"].append(entry)
+    return tree
+
+def index_fedata(fedata_files: list):
+    """
+    Return dict, key: folder, value: path of first fedata.* file in walk order
+    within that folder or its subfolders, as find_path_from_list() finds it.
+    """
+    index = {}
+    for entry in fedata_files:
+        folder = os.path.dirname(entry.path)
+        while folder not in index:  # ancestors of indexed folders are indexed
+            index[folder] = entry.path
+            parent = os.path.dirname(folder)
+            if parent == folder:
+                break
+            folder = parent
+    return index
+
 def find_matching_file(flist: list, searchme: list):
     """
     Find matching file from two lists of files. Return index of first file found.
@@ -75,38 +151,48 @@ def find_matching_file(flist: list, searchme: list):
 
 
 # util
-def get_fedata_buf(path: pathlib.Path, start = -1, end = -1):
+fedata_flist = [ "fedata" + ext for ext in [ ".bri", ".eng", ".fre", ".ger", ".ita", ".spa", ".swe" ] ]
+
+def get_fedata_buf(path: pathlib.Path, start = -1, end = -1, fedata_paths: list = None):
+    """
+    fedata_paths: loose fedata.* files found for path by the caller, first
+        one is used. If None, search the folder of path.
+    """
     if start < 0 or end < 0:
-        fname = "fedata"
-        fendings = [ ".eng", ".bri", ".fre", ".ger", ".ita", ".spa", ".swe" ]
-        flist = [ fname + ext for ext in fendings ]
-        path = find_path_from_list(path.parent, flist)
+        if fedata_paths is None:
+            fname = "fedata"
+            fendings = [ ".eng", ".bri", ".fre", ".ger", ".ita", ".spa", ".swe" ]
+            flist = [ fname + ext for ext in fendings ]
+            path = find_path_from_list(path.parent, flist)
+        else:
+            path = pathlib.Path(fedata_paths[0]) if len(fedata_paths) > 0 else None
 
         # print(f"path: {path}", flush=True)
         if path is None:
             return None
 
         fsz = os.path.getsize(path)
-        buf = GetBufAt(path, 0, fsz)
+        with scl_perf.stage("read", nbytes=fsz):
+            buf = GetBufRange(path, 0, fsz)
     else:
         # print(f"path: {path}", flush=True)
-        buf = GetBufAt(path, start, end)
+        buf = scl_refpack.CACHE.get_buf_at(path, start, end)
 
     return buf
 
-def get_car_metadata(path: pathlib.Path, fce_version, start = -1, end = -1):
+def get_car_metadata(path: pathlib.Path, fce_version, start = -1, end = -1, buf = None, fedata_paths: list = None):
     fedata = None
     df_fedata = None
 
-    buf = None
-    if fce_version in [3, 4]:
-        buf = get_fedata_buf(path, start, end)
+    if fce_version in [3, 4] and buf is None:
+        buf = get_fedata_buf(path, start, end, fedata_paths)
 
     if buf is not None:
         if fce_version in [3, 4]:
-            fedata = scl_libfedata.FEData()
-            fedata.read_fedata(buf)
-            df_fedata = fedata.export_polars()
+            with scl_perf.stage("fedata", nbytes=len(buf)):
+                fedata = scl_libfedata.FEData()
+                fedata.read_fedata(buf)
+                df_fedata = fedata.export_polars()
             # print(fedata)
         elif fce_version == 5:
             pass
@@ -115,162 +201,523 @@ def get_car_metadata(path: pathlib.Path, fce_version, start = -1, end = -1):
     return fedata, df_fedata
 
 
+class VivSession:
+    """
+    Read all entries of one VIV archive through a single open file (or the
+    decompressed mmap for RefPack archives). Parses fedata once per archive.
 
-
+    with VivSession(vivpath) as viv:
+        buf = viv.get_buf_at(start, end)
+    """
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.f = None
+        self.mm = None
+        self.size = 0
+        self.mtime_ns = None
+        self.fedata = {}  # key: (start, end), value: (FEData, DataFrame)
+
+    def __enter__(self):
+        self.f = open(self.path, "rb")
+        st = os.fstat(self.f.fileno())
+        self.mtime_ns = st.st_mtime_ns
+        self.size = st.st_size
+        self.mm = scl_refpack.CACHE.get(self.path, self.f, st)
+        if self.mm is not None:
+            self.f.close()
+            self.f = None
+        return self
+
+    def __exit__(self, *exc):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        self.mm = None
+
+    def get_buf_at(self, start, end):
+        with scl_perf.stage("read") as st:
+            buf = self._read_at(start, end)
+            st.nbytes = len(buf)
+        return buf
+
+    def _read_at(self, start, end):
+        if self.mm is not None:
+            return self.mm[start:end]
+        end = min(end, self.size)
+        if start >= end:
+            return b""
+        if hasattr(os, "pread"):
+            return os.pread(self.f.fileno(), end - start, start)
+        self.f.seek(start)
+        return self.f.read(end - start)
+
+    def get_car_metadata(self, fce_version, start, end):
+        """ Same as get_car_metadata(), fedata entry is read and parsed once """
+        if fce_version not in [3, 4]:
+            return None, None
+        if (start, end) not in self.fedata:
+            self.fedata[(start, end)] = get_car_metadata(self.path, fce_version, buf=self.get_buf_at(start, end))
+        return self.fedata[(start, end)]
+
+
+fce_header_size = 0x2038
+
+def get_mesh_from_buf(buf):
+    with scl_perf.stage("decode", nbytes=len(buf)):
+        mesh = fc.Mesh()
+        mesh = LoadFceFromBuf(mesh, buf)
+        fce_version = GetFceVersionFromBuf(buf)
+    return mesh, fce_version
 
 def get_mesh_from_binary(path, start, end):
-    buf = GetBufAt(path, start, end)
-    mesh = fc.Mesh()
-    mesh = LoadFceFromBuf(mesh, buf)
-    fce_version = GetFceVersionFromBuf(buf)
-    return mesh, fce_version
+    buf = scl_refpack.CACHE.get_buf_at(path, start, end)
+    return get_mesh_from_buf(buf)
+
+_mesh_info_cache = {}  # key: (size, FCE header), value: [(source, mesh_info, version), ...]
+
+def get_mesh_info_from_buf(buf, source: tuple = None):
+    """
+    Return (mesh_info, version). Byte-identical FCE data is decoded once per
+    process, duplicates reuse the cached mesh info.
+
+    Candidates are looked up by size and header. Only then is buf compared in
+    full against the first copy, re-read from its source (path, start, end).
+    If source is None, buf is decoded and not cached.
+    """
+    key = (len(buf), bytes(buf[:fce_header_size]))
+    candidates = _mesh_info_cache.get(key, []) if source is not None else []
+    for source_, mesh_info, version in candidates:
+        with scl_perf.stage("compare", nbytes=len(buf)):
+            if scl_refpack.CACHE.get_buf_at(*source_) == buf:
+                return mesh_info, version
+    mesh, version = get_mesh_from_buf(buf)
+    with scl_perf.stage("mesh_info"):
+        mesh_info = get_mesh_info(mesh) if version >= 0 else None
+    if source is not None:
+        _mesh_info_cache.setdefault(key, []).append((source, mesh_info, version))
+    return mesh_info, version
+
+def get_fce_hash(buf):
+    """ BLAKE2b-128 hex digest of FCE data, see fce_schema "hash" """
+    with scl_perf.stage("hash", nbytes=len(buf)):
+        return hashlib.blake2b(buf, digest_size=16).hexdigest()
 
 def get_fce_info(mesh):
-    MGetColors = np.array(mesh.MGetColors())
+    """
+    Numeric list fields are returned as flat int64 / float64 arrays, which
+    polars takes as typed list columns without going through Python lists.
+    """
+    MGetColors = mesh.MGetColors()
     NumColors = MGetColors.shape[0]
-    MGetColors = np.array(MGetColors).flatten().tolist()
+    MGetColors = MGetColors.astype(np.int64).reshape(-1)
 
     MGetDummyNames = mesh.MGetDummyNames()
     NumDummies = len(MGetDummyNames)
-    MGetDummyPos = mesh.MGetDummyPos()
-    MGetDummyPos = np.array(MGetDummyPos).flatten().tolist()
-
-    PGetName = [mesh.PGetName(i) for i in range(mesh.MNumParts)]
-    PGetPos = np.array([mesh.PGetPos(i) for i in range(mesh.MNumParts)]).flatten().tolist()
-    PNumTriags = [mesh.PNumTriags(i) for i in range(mesh.MNumParts)]
-    PNumVerts = [mesh.PNumVerts(i) for i in range(mesh.MNumParts)]
+    MGetDummyPos = np.asarray(mesh.MGetDummyPos(), dtype=np.float64).reshape(-1)
+
+    # part-level fields, bound methods mapped over all part indices
+    idx = range(mesh.MNumParts)
+    PGetName = list(map(mesh.PGetName, idx))
+    PGetPos = np.concatenate(list(map(mesh.PGetPos, idx)) or [np.empty(0)]).astype(np.float64)
+    PNumTriags = np.fromiter(map(mesh.PNumTriags, idx), dtype=np.int64, count=len(idx))
+    PNumVerts = np.fromiter(map(mesh.PNumVerts, idx), dtype=np.int64, count=len(idx))
     # mesh.PrintInfo()
 
     return NumColors, MGetColors, NumDummies, MGetDummyNames, MGetDummyPos, PGetName, PGetPos, PNumTriags, PNumVerts
 
 
-def build_tdf(path: pathlib.Path, format: str, offset, size, name, version, mesh, fedata: dict):
+def get_fce_header_info(buf):
+    """
+    Return mesh columns of fce_schema from the FCE header alone, without
+    decoding the mesh. Same values as get_mesh_info() for valid files.
+    Returns None for unknown versions.
+
+    References:
+        fcecodec/src/fcelib/fcelib_fcetypes.h
+    """
+    version = GetFceVersionFromBuf(buf)
+    if version == 3:
+        hdr_size = 0x1F04
+        ofs = {"NumTriangles": 0x0004, "NumVertices": 0x0008, "NumArts": 0x000C,
+               "NumDummies": 0x0034, "Dummies": 0x0038, "NumParts": 0x00F8, "Parts": 0x00FC,
+               "PNumVertices": 0x04FC, "PNumTriangles": 0x06FC,
+               "NumColors": 0x07FC, "PriColors": 0x0800, "SecColors": 0x0904,
+               "DummyNames": 0x0A04, "PartNames": 0x0E04}
+    elif version in [4, 5]:
+        hdr_size = 0x2038
+        ofs = {"NumTriangles": 0x0008, "NumVertices": 0x000C, "NumArts": 0x0010,
+               "NumDummies": 0x0058, "Dummies": 0x005C, "NumParts": 0x011C, "Parts": 0x0120,
+               "PNumVertices": 0x0520, "PNumTriangles": 0x0720,
+               "NumColors": 0x0820, "PriColors": 0x0824, "IntColors": 0x0864, "SecColors": 0x08A4, "DriColors": 0x08E4,
+               "Unknown3": 0x0924, "DummyNames": 0x0A28, "PartNames": 0x0E28}
+    else:
+        return None
+    if len(buf) < hdr_size:
+        return None
+
+    def u32(key):
+        return struct.unpack_from("<I", buf, ofs[key])[0]
+
+    def name64(key, i):
+        s = bytes(buf[ofs[key] + 64 * i : ofs[key] + 64 * (i + 1)])
+        return s.split(b"\x00", 1)[0].decode("utf-8", "backslashreplace")
+
+    NumParts = min(u32("NumParts"), 64)
+    NumDummies = min(u32("NumDummies"), 16)
+    NumColors = min(u32("NumColors"), 16)
+
+    if version == 3:
+        # tColor3: 4x uint32; FCE3 has primary and secondary colors only,
+        # loaded as (primary, secondary, secondary, primary)
+        pri = np.frombuffer(buf, dtype="<u4", count=NumColors * 4, offset=ofs["PriColors"]).reshape(-1, 4)
+        sec = np.frombuffer(buf, dtype="<u4", count=NumColors * 4, offset=ofs["SecColors"]).reshape(-1, 4)
+        MGetColors = np.stack([pri, sec, sec, pri], axis=1) & 0xFF
+    else:
+        # tColor: 4x uint8; primary, interior, secondary, driver
+        MGetColors = np.stack([
+            np.frombuffer(buf, dtype=np.uint8, count=NumColors * 4, offset=ofs[k]).reshape(-1, 4)
+            for k in ["PriColors", "IntColors", "SecColors", "DriColors"]
+        ], axis=1)
+
+    # same array types as get_fce_info()
+    return {
+        "MNumParts": NumParts,
+        "MNumTriags": u32("NumTriangles"),
+        "MNumVerts": u32("NumVertices"),
+        "MNumArts": u32("NumArts"),
+        "MUnknown3": u32("Unknown3") if version == 5 else 0,
+
+        "NumColors": NumColors,
+        "MGetColors": MGetColors.astype(np.int64).reshape(-1),
+
+        "NumDummies": NumDummies,
+        "MGetDummyNames": [name64("DummyNames", i) for i in range(NumDummies)],
+        "MGetDummyPos": np.frombuffer(buf, dtype="<f4", count=NumDummies * 3, offset=ofs["Dummies"]).astype(np.float64),
+
+        "PGetName": [name64("PartNames", i) for i in range(NumParts)],
+        "PGetPos": np.frombuffer(buf, dtype="<f4", count=NumParts * 3, offset=ofs["Parts"]).astype(np.float64),
+        "PNumTriags": np.frombuffer(buf, dtype="<u4", count=NumParts, offset=ofs["PNumTriangles"]).astype(np.int64),
+        "PNumVerts": np.frombuffer(buf, dtype="<u4", count=NumParts, offset=ofs["PNumVertices"]).astype(np.int64),
+    }
+
+def get_mesh_info(mesh):
+    """ Return mesh columns of fce_schema from decoded mesh """
     NumColors, MGetColors, NumDummies, MGetDummyNames, MGetDummyPos, PGetName, PGetPos, PNumTriags, PNumVerts = get_fce_info(mesh)
+    return {
+        "MNumParts": mesh.MNumParts,
+        "MNumTriags": mesh.MNumTriags,
+        "MNumVerts": mesh.MNumVerts,
+        "MNumArts": mesh.MNumArts,
+        "MUnknown3": mesh.MUnknown3,
+
+        "NumColors": NumColors,
+        "MGetColors": MGetColors,
+
+        "NumDummies": NumDummies,
+        "MGetDummyNames": MGetDummyNames,
+        "MGetDummyPos": MGetDummyPos,
+
+        "PGetName": PGetName,
+        "PGetPos": PGetPos,
+        "PNumTriags": PNumTriags,
+        "PNumVerts": PNumVerts,
+    }
+
+
+def build_row(path: pathlib.Path, format: str, offset, size, name, version, mesh, fedata: dict, fce_hash: str = None, mtime_ns: int = None,
+              header_only: bool = False, fedata_path: pathlib.Path = None, fedata_mtime_ns: int = None):
+    """ mesh: fc.Mesh, or dict from get_fce_header_info() / get_mesh_info() """
+    mesh_info = mesh if isinstance(mesh, dict) else get_mesh_info(mesh)
 
     fedata = fedata if fedata is not None else {}
 
-    tdf = pl.DataFrame(
-        {
-            "car_name": [fedata.get("car_name", None)],
-            "path": [path.as_posix()],
-            "format": [format],
-            "offset": [offset],
-            "size": [size],
+    row = {
+        "car_name": fedata.get("car_name", None),
+        "path": path.as_posix(),
+        "format": format,
+        "offset": offset,
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "hash": fce_hash,
+        "header_only": header_only,
+        "fedata_path": pathlib.Path(fedata_path).as_posix() if fedata_path is not None else None,
+        "fedata_mtime_ns": fedata_mtime_ns,
+
+        "name": name,
+        "version": version,
+        **mesh_info,
+    }
+    return row
+
+def get_mesh_header_from_buf(buf):
+    """ Header-only counterpart of get_mesh_from_buf(), returns (dict, version) """
+    fce_version = GetFceVersionFromBuf(buf)
+    with scl_perf.stage("header", nbytes=len(buf)):
+        mesh_info = get_fce_header_info(buf)
+    if mesh_info is None:
+        return None, -1
+    return mesh_info, fce_version
+
+def with_fedata_key(tdf_fedata: pl.DataFrame, path: pathlib.Path, offset: int):
+    """ Prepend (path, offset) of the FCE row the fedata row belongs to """
+    return tdf_fedata.select(
+        pl.lit(path.as_posix(), dtype=pl.String).alias("path"),
+        pl.lit(offset, dtype=pl.Int64).alias("offset"),
+        pl.all(),
+    )
+
+def analyze_viv_archive(vivpath: str, entries: list, header_only: bool = False, opt_hash: bool = False):
+    """
+    Decode FCE entries of one archive, entries are rows of the FCE entry
+    table. Return (cols, fedata_tdfs, FileNotFoundError_list), cols holds
+    fce_schema columns. If header_only, read only the FCE headers. If
+    opt_hash, fill column "hash" (not in header-only mode).
+
+    Module-level so it can be dispatched to worker processes.
+    """
+    cols = {k: [] for k in fce_schema}
+    fedata_tdfs = []
+    FileNotFoundError_list = []
 
-            "name": [name],
-            "version": [version],
-            "MNumParts": [mesh.MNumParts],
-            "MNumTriags": [mesh.MNumTriags],
-            "MNumVerts": [mesh.MNumVerts],
-            "MNumArts": [mesh.MNumArts],
-            "MUnknown3": [mesh.MUnknown3],
+    vivpath = pathlib.Path(vivpath)
+    if not os.access(vivpath, os.R_OK):
+        FileNotFoundError_list.append(vivpath)
+        return cols, fedata_tdfs, FileNotFoundError_list
+    scl_log.log.debug("%s", vivpath)
+
+    with VivSession(vivpath) as viv:
+        for entry in entries:
+            # get FCE file
+            fce = entry["file"]
+            scl_log.log.debug("  %s", fce)
+            start = entry["offset"]
+            end = entry["size"] + start
+
+            # get mesh from FCE within VIV
+            fce_hash = None
+            if header_only:
+                mesh, version = get_mesh_header_from_buf(viv.get_buf_at(start, min(end, start + fce_header_size)))
+            else:
+                buf = viv.get_buf_at(start, end)
+                mesh, version = get_mesh_info_from_buf(buf, (vivpath, start, end))
+                if opt_hash:
+                    fce_hash = get_fce_hash(buf)
+
+            if version < 0:
+                FileNotFoundError_list.append(vivpath)
+                continue
 
-            "NumColors": [ NumColors ],
-            "MGetColors": [ MGetColors ],
+            # get carname from fedata et al.
+            fedata = None
 
-            "NumDummies": [ NumDummies ],
-            "MGetDummyNames": [ MGetDummyNames ],
-            "MGetDummyPos": [ MGetDummyPos ],
+            if entry["fedata_offset"] is not None:
+                fedata_start = entry["fedata_offset"]
+                fedata_end = entry["fedata_size"] + fedata_start
+                fedata, tdf_fedata = viv.get_car_metadata(version, fedata_start, fedata_end)
+                if fedata is not None:
+                    fedata = fedata.get_data()
+                if tdf_fedata is not None:
+                    fedata_tdfs.append(with_fedata_key(tdf_fedata, vivpath, start))
 
-            "PGetName": [ PGetName ],
-            "PGetPos": [ PGetPos ],
-            "PNumTriags": [ PNumTriags ],
-            "PNumVerts": [ PNumVerts ],
+            # add row
+            fce_row = build_row(vivpath, "viv", start, end, fce, version, mesh, fedata, fce_hash, viv.mtime_ns, header_only)
+            for k in cols: cols[k].append(fce_row[k])
 
+    return cols, fedata_tdfs, FileNotFoundError_list
 
-        }
-    )
-    return tdf
-
-def fce_analyze(df_viv: pl.DataFrame, opt_FCEondisk: bool, inpath: pathlib.Path = None):
-    df = pl.DataFrame(
-        schema={
-            "car_name": str,
-            "path": str,
-            "format": str,
-            "offset": int,
-            "size": int,
-
-            "name": str,
-            "version": int,
-            "MNumParts": int,
-            "MNumTriags": int,
-            "MNumVerts": int,
-            "MNumArts": int,
-            "MUnknown3": int,
-
-            "NumColors": int,
-            "MGetColors": pl.List(int),
-
-            "NumDummies": int,
-            "MGetDummyNames": pl.List(str),
-            "MGetDummyPos": pl.List(float),
-
-            "PGetName": pl.List(str),
-            "PGetPos": pl.List(float),
-            "PNumTriags": pl.List(int),
-            "PNumVerts": pl.List(int),
-        }
-    )
-    print(df)
+def analyze_fce_file(filepath: str, fedata_paths: list = None, header_only: bool = False, opt_hash: bool = False):
+    """
+    Decode one FCE file on disk. Same return values as analyze_viv_archive().
+    fedata_paths: see get_fedata_buf(); if None, searched here
 
+    Module-level so it can be dispatched to worker processes.
+    """
+    cols = {k: [] for k in fce_schema}
+    fedata_tdfs = []
     FileNotFoundError_list = []
 
-    df_fedata = pl.DataFrame()
+    filepath = pathlib.Path(filepath)
+    scl_log.log.debug("%s", filepath)
+
+    # get filepath filesize
+    st = os.stat(filepath)
+    fsz = st.st_size
 
+    # get mesh from FCE
+    fce_hash = None
+    if header_only:
+        mesh, version = get_mesh_header_from_buf(scl_refpack.CACHE.get_buf_at(filepath, 0, min(fsz, fce_header_size)))
+    else:
+        buf = scl_refpack.CACHE.get_buf_at(filepath, 0, fsz)
+        mesh, version = get_mesh_info_from_buf(buf, (filepath, 0, fsz))
+        if opt_hash:
+            fce_hash = get_fce_hash(buf)
+
+    if version < 0:
+        FileNotFoundError_list.append(filepath)
+        return cols, fedata_tdfs, FileNotFoundError_list
+
+    # get carname from fedata et al.
+    if fedata_paths is None:
+        fedata_path = find_path_from_list(filepath.parent, fedata_flist)
+        fedata_paths = [fedata_path] if fedata_path is not None else []
+    fedata_path = fedata_paths[0] if len(fedata_paths) > 0 else None
+    fedata_mtime_ns = os.stat(fedata_path).st_mtime_ns if fedata_path is not None else None
+    fedata, tdf_fedata = get_car_metadata(filepath, version, fedata_paths=fedata_paths)
+    if fedata is not None:
+        fedata = fedata.get_data()
+    if tdf_fedata is not None:
+        fedata_tdfs.append(with_fedata_key(tdf_fedata, filepath, 0))
+
+    # add row
+    fce_row = build_row(filepath, "fce", 0, fsz, filepath.stem, version, mesh, fedata, fce_hash, st.st_mtime_ns, header_only,
+                        fedata_path, fedata_mtime_ns)
+    for k in cols: cols[k].append(fce_row[k])
+
+    return cols, fedata_tdfs, FileNotFoundError_list
+
+def map_jobs(func, *iterables, jobs: int = 1, executor: concurrent.futures.Executor = None, hints: list = None):
+    """
+    Return iterator of func results in submission order. If executor is
+    given, all tasks are submitted to it right away, so several stages can
+    share one pool. Otherwise if jobs != 1, run on a process pool with jobs
+    workers (0 uses all cores).
+
+    hints: per task [(path, ranges), ...] the task will read; if given and
+        tasks run serially, reads are hinted ahead, see scl_fsutil.readahead()
+    """
+    iterables = [list(it) for it in iterables]
+    n = len(iterables[0]) if iterables else 0
+    max_workers = jobs if jobs > 0 else os.cpu_count()
+    chunksize = max(1, n // (max_workers * 16))
+    if executor is None and (jobs == 1 or n < 2):
+        if hints is not None:
+            tasks = scl_fsutil.readahead(zip(hints, *iterables), lambda task: task[0])
+            return (func(*task[1:]) for task in tasks)
+        return map(func, *iterables)
+    timed = scl_perf.CONFIG["enabled"]  # collect stage stats from workers
+    func_ = scl_perf.collect(func) if timed else func
+    if executor is not None:
+        results = executor.map(func_, *iterables, chunksize=chunksize)
+    else:
+        results = _map_pool(func_, iterables, max_workers, chunksize)
+    return scl_perf.merged(results) if timed else results
+
+def _map_pool(func, iterables, max_workers, chunksize):
+    with scl_pool.process_pool(max_workers) as executor:
+        yield from executor.map(func, *iterables, chunksize=chunksize)
+
+def fce_analyze(df_viv: pl.DataFrame, opt_FCEondisk: bool, inpath: pathlib.Path = None, jobs: int = 1, header_only: bool = False,
+                df_cache: pl.DataFrame = None, df_fedata_cache: pl.DataFrame = None, tree: dict = None, opt_hash: bool = False):
+    """
+    jobs: number of worker processes for decoding, 0 uses all cores. Work is
+        distributed per archive and per FCE file on disk; both run on one
+        pool at the same time. Results are merged in serial order. If
+        serial, entry ranges of upcoming tasks are hinted to the OS on I/O
+        threads, see scl_fsutil.readahead().
+    header_only: fill mesh columns from the FCE header (first 0x2038 bytes)
+        instead of decoding the mesh
+    df_cache, df_fedata_cache: previous result. FCE rows whose (path, offset,
+        size, mtime_ns) match the current entry are reused instead of decoded,
+        together with their fedata rows. FCE files on disk also need the same
+        loose fedata.* file (fedata_path, fedata_mtime_ns). Header-only rows are not reused for
+        full decoding, rows without hash are not reused if opt_hash.
+    tree: walk_tree(inpath) result from an earlier stage; if given, inpath is
+        not walked again. Loose fedata.* files are looked up in the same walk.
+    opt_hash: fill column "hash" with a content hash of each FCE, e.g., to
+        find copies in the SQLite catalog. Not in header-only mode.
+
+    Byte-identical FCE data is decoded once per process, see
+    get_mesh_info_from_buf().
+
+    Returned df_fedata rows are linked to FCE rows by (path, offset).
+    """
+    _mesh_info_cache.clear()
+
+    # accumulate column-wise, build DataFrames once
+    cols = {k: [] for k in fce_schema}
+    fedata_tdfs = []
+
+    FileNotFoundError_list = []
+
+    def merge(results, progress):
+        for cols_, fedata_tdfs_, FileNotFoundError_list_ in results:
+            progress.update(nbytes=sum(cols_["size"]) - sum(cols_["offset"]))
+            for k in cols: cols[k].extend(cols_[k])
+            fedata_tdfs.extend(fedata_tdfs_)
+            FileNotFoundError_list.extend(FileNotFoundError_list_)
+
+    # reuse unchanged entries, key: (path, offset, size), value: (mtime_ns, fedata_path, fedata_mtime_ns)
+    cache = {}
+    if df_cache is not None:
+        df_cache = df_cache.select(list(fce_schema)).cast(fce_schema)
+        if not header_only:
+            df_cache = df_cache.filter(~pl.col("header_only"))
+            if opt_hash:
+                df_cache = df_cache.filter(pl.col("hash").is_not_null())
+        for path, offset, size, *ident in df_cache.select("path", "offset", "size", "mtime_ns", "fedata_path", "fedata_mtime_ns").iter_rows():
+            cache[(path, offset, size)] = tuple(ident)
+    order = []  # keys of all entries, serial order
+    reused = []  # keys of reused entries
+
+    def is_cached(key, mtime_ns, fedata_path=None, fedata_mtime_ns=None):
+        order.append(key)
+        if mtime_ns is not None and cache.get(key) == (mtime_ns, fedata_path, fedata_mtime_ns):
+            reused.append(key)
+            return True
+        return False
+
+    def get_mtime_ns(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    # tasks, one per archive and one per FCE file on disk
+    vivpaths = []
+    entries = []
+    filepaths = []
+    fedata_paths = []
+    hints_viv = []  # ranges each task reads, see map_jobs()
+    hints_fce = []
+
+    def get_range(start, size):
+        return (start, start + (min(size, fce_header_size) if header_only else size))
 
     # Iterate all VIV archives, then iterate all its FCE files.
     # For each FCE file, get mesh data.
     if df_viv is not None:
-        fname = "fedata"
-        fendings = [ ".bri", ".eng", ".fre", ".ger", ".ita", ".spa", ".swe" ]
-        fedatalist = [ fname + ext for ext in fendings ]
-
-        for row in df_viv.iter_rows(named=True):
-            # print(row)
-            vivpath = pathlib.Path(row["path"])
-            if not os.access(vivpath, os.R_OK):
-                FileNotFoundError_list.append(vivpath)
-                continue
-            print(vivpath)
-
-            for i in range(len(row["files"])):
-                # get FCE file
-                fce = row["files"][i]
-                if str(fce).lower().find(".fce") < 0:
-                    continue
-                print(fce)
-                start = row["files_offsets"][i]
-                end = row["files_sizes"][i] + start
-
-                # get mesh from FCE within VIV
-                mesh, version = get_mesh_from_binary(vivpath, start, end)
+        # one row per FCE entry, with first fedata.* entry of its archive
+        df_entries = scl_libvivanalyze.build_entries(df_viv)
+        df_fedata_entries = scl_libvivanalyze.find_entries(df_entries, names=fedata_flist).group_by(
+            "archive_id", maintain_order=True
+        ).first().select(
+            "archive_id",
+            pl.col("offset").alias("fedata_offset"),
+            pl.col("size").alias("fedata_size"),
+        )
+        df_fce_entries = scl_libvivanalyze.find_entries(df_entries, exts=[".fce"]).join(
+            df_fedata_entries, on="archive_id", how="left", maintain_order="left"
+        )
 
-                if version < 0:
-                    FileNotFoundError_list.append(vivpath)
+        # one task per archive, entries are grouped by archive_id
+        for (archive_id,), df_archive in df_fce_entries.group_by("archive_id", maintain_order=True):
+            vivpath = df_archive.item(0, "path")
+            entries_ = df_archive.select("file", "offset", "size", "fedata_offset", "fedata_size").to_dicts()
+            if cache:
+                mtime_ns = get_mtime_ns(vivpath)
+                path_ = pathlib.Path(vivpath).as_posix()
+                entries_ = [
+                    entry for entry in entries_
+                    if not is_cached((path_, entry["offset"], entry["offset"] + entry["size"]), mtime_ns)
+                ]
+                if len(entries_) < 1:
                     continue
-
-                # get carname from fedata et al.
-                fedata = None
-
-                fedata_idx = find_matching_file(row["files"], fedatalist)
-                # print(f"fedata_idx: {fedata_idx}")
-                if fedata_idx is not None:
-                    # print(f"fedata name: {row["files"][fedata_idx]}")
-                    fedata_start = row["files_offsets"][fedata_idx]
-                    fedata_end = row["files_sizes"][fedata_idx] + fedata_start
-                    fedata, tdf_fedata = get_car_metadata(vivpath, version, fedata_start, fedata_end)
-                    if fedata is not None:
-                        fedata = fedata.get_data()
-                    if tdf_fedata is not None:
-                        try:
-                            df_fedata = df_fedata.vstack(tdf_fedata)
-                        except Exception as e:
-                            print(e)
-
-                # add row to DataFrame
-                tdf = build_tdf(vivpath, "viv", start, end, fce, version, mesh, fedata)
-                df = df.vstack(tdf)
+            vivpaths.append(vivpath)
+            entries.append(entries_)
+            ranges = {get_range(entry["offset"], entry["size"]) for entry in entries_}
+            ranges |= {(entry["fedata_offset"], entry["fedata_offset"] + entry["fedata_size"]) for entry in entries_ if entry["fedata_offset"] is not None}
+            hints_viv.append([(vivpath, sorted(ranges))])
 
     # Iterate over all files in a directory, skip non-FCE.
     # For each FCE file, get mesh data.
@@ -278,69 +725,224 @@ def fce_analyze(df_viv: pl.DataFrame, opt_FCEondisk: bool, inpath: pathlib.Path
         inpath_ = pathlib.Path(inpath)
 
         if inpath_.is_dir():
-            for subdir, dirs, files in os.walk(inpath_):
-                for file in files:
-                    b = str(file).isprintable()
-                    if not b:
+            if tree is None:
+                tree = walk_tree(inpath_)
+            fedata_index = index_fedata(tree["fedata"])
+            for entry in tree["fce"]:
+                # # Skip if filepath is in list
+                # skip = pathlib.Path(entry.path).as_posix() in [
+                #     # uvt.get_info(path)
+                #     # 'path/to/file',
+                #     ]
+                # if skip:
+                #     print(f"skip: {skip}", pathlib.Path(entry.path).as_posix())
+                #     continue
+
+                fedata_path = fedata_index.get(os.path.dirname(entry.path))
+                if cache:
+                    st = entry.stat()
+                    if fedata_path is None:
+                        fedata_key = (None, None)
+                    else:
+                        fedata_key = (pathlib.Path(fedata_path).as_posix(), get_mtime_ns(fedata_path))
+                    if is_cached((pathlib.Path(entry.path).as_posix(), 0, st.st_size), st.st_mtime_ns, *fedata_key):
                         continue
-                    filepath = (pathlib.Path(subdir) / file)
-
-                    # # Skip if filepath is in list
-                    # skip = filepath.as_posix() in [
-                    #     # uvt.get_info(path)
-                    #     # 'path/to/file',
-                    #     ]
-                    # if skip:
-                    #     print(f"skip: {skip}", filepath.as_posix())
-                    #     continue
-
-                    if filepath.suffix.lower() != ".fce":
-                        continue
-                    print(filepath)
+                filepaths.append(entry.path)
+                fedata_paths.append([fedata_path] if fedata_path is not None else [])
+                hints_fce.append([(entry.path, [get_range(0, entry.stat().st_size)])] + [(p, None) for p in fedata_paths[-1]])
+
+    # archive and loose FCE tasks share one pool
+    parallel = jobs != 1 and len(vivpaths) + len(filepaths) > 1
+    max_workers = jobs if jobs > 0 else os.cpu_count()
+    with scl_pool.process_pool(max_workers) if parallel else contextlib.nullcontext() as executor:
+        results_viv = map_jobs(functools.partial(analyze_viv_archive, header_only=header_only, opt_hash=opt_hash), vivpaths, entries, jobs=jobs, executor=executor, hints=hints_viv)
+        results_fce = map_jobs(functools.partial(analyze_fce_file, header_only=header_only, opt_hash=opt_hash), filepaths, fedata_paths, jobs=jobs, executor=executor, hints=hints_fce)
+        with scl_log.Progress("fce", total=len(vivpaths) + len(filepaths)) as progress:
+            merge(results_viv, progress)
+            merge(results_fce, progress)
+
+    with scl_perf.stage("dataframe"):
+        df = pl.DataFrame(cols, schema=fce_schema)
+        if len(reused) > 0:
+            # merge reused rows, restore serial order
+            key_schema = {"path": str, "offset": int, "size": int}
+            df_order = pl.DataFrame(order, schema=key_schema, orient="row").unique(maintain_order=True)
+            df_reused = df_cache.join(
+                pl.DataFrame(reused, schema=key_schema, orient="row").unique(), on=list(key_schema), how="semi"
+            )
+            df = df_order.join(
+                pl.concat([df, df_reused]), on=list(key_schema), how="inner", maintain_order="left"
+            ).select(list(fce_schema))
+            if df_fedata_cache is not None and {"path", "offset"}.issubset(df_fedata_cache.columns):
+                fedata_tdfs.append(df_fedata_cache.join(
+                    df_reused.select("path", "offset").unique(), on=["path", "offset"], how="semi"
+                ))
+
+        df_fedata = pl.DataFrame()
+        if len(fedata_tdfs) > 0:
+            try:
+                df_fedata = pl.concat(fedata_tdfs, how="vertical_relaxed")
+                if len(reused) > 0:
+                    df_fedata = df.select("path", "offset").unique(maintain_order=True).join(
+                        df_fedata, on=["path", "offset"], how="inner", maintain_order="left"
+                    )
+            except Exception as e:
+                scl_log.log.warning("%s", e)
 
-                    # get filepath filesize
-                    fsz = os.path.getsize(filepath)
+    return df, FileNotFoundError_list, df_fedata
 
-                    # get mesh from FCE
-                    mesh, version = get_mesh_from_binary(filepath, 0, fsz)
 
-                    if version < 0:
-                        FileNotFoundError_list.append(filepath)
-                        continue
+# streaming
+def prefetch_iter(iterable, depth: int = 1):
+    """
+    Yield items of iterable, producing up to depth items ahead on a background
+    thread. Exceptions are re-raised in the caller. If the caller stops early,
+    the thread stops and closes iterable.
+    """
+    q = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        it = iter(iterable)
+        try:
+            for item in it:
+                if not put((item, None)):
+                    break
+            else:
+                put((done, None))
+        except BaseException as e:
+            put((done, e))
+        finally:
+            if hasattr(it, "close"):
+                it.close()
+
+    t = threading.Thread(target=producer, daemon=True)
+    t.start()
+    try:
+        while True:
+            item, e = q.get()
+            if item is done:
+                if e is not None:
+                    raise e
+                return
+            yield item
+    finally:
+        stop.set()
+        t.join()
+
+def _iter_fce_entries(inpath: pathlib.Path, decode: bool, files: list):
+    inpath_ = pathlib.Path(inpath)
+    if files is None:
+        files = scl_fsutil.walk_files(inpath_) if inpath_.is_dir() else [inpath_]
+
+    for entry in files:
+        filepath = pathlib.Path(entry)
+
+        # loose FCE file
+        if filepath.suffix.lower() == ".fce":
+            buf = scl_refpack.CACHE.get_buf_at(filepath, 0, os.path.getsize(filepath))
+            version = GetFceVersionFromBuf(buf)
+            if version < 0:
+                continue
+            mesh = get_mesh_from_buf(buf)[0] if decode else buf
+            yield filepath, 0, len(buf), version, mesh
+            continue
+
+        # FCE entries in VIV archive
+        if scl_libvivanalyze.CONFIG["opt_prefilter"] and not scl_libvivanalyze.has_viv_magic(filepath):
+            continue
+        _, row = scl_libvivanalyze.analyze_viv_file(filepath)
+        if row is None or not row["files"]:
+            continue
+        with VivSession(filepath) as viv:
+            for fce, start, size in zip(row["files"], row["files_offsets"], row["files_sizes"]):
+                if fce is None or not fce.lower().endswith(".fce"):
+                    continue
+                buf = viv.get_buf_at(start, start + size)
+                version = GetFceVersionFromBuf(buf)
+                if version < 0:
+                    continue
+                mesh = get_mesh_from_buf(buf)[0] if decode else buf
+                yield filepath, start, size, version, mesh
 
-                    # get carname from fedata et al.
-                    fedata, tdf_fedata = get_car_metadata(filepath, version)
-                    if fedata is not None:
-                        fedata = fedata.get_data()
-                    if tdf_fedata is not None:
-                        try:
-                            df_fedata = df_fedata.vstack(tdf_fedata)
-                        except Exception as e:
-                            print(e)
+def iter_fce_entries(inpath: pathlib.Path, decode: bool = True, prefetch: int = 0, files: list = None):
+    """
+    Lazily yield (path, offset, size, version, mesh) for every FCE in VIV
+    archives and loose FCE files in inpath (folder or single file), walk
+    order. No catalog is built; one archive and up to prefetch entries are
+    held in memory.
 
-                    # add row to DataFrame
-                    tdf = build_tdf(filepath, "fce", 0, fsz, filepath.stem, version, mesh, fedata)
-                    df = df.vstack(tdf)
+    decode: if True, mesh is fcecodec.Mesh, else the FCE data (bytes)
+    prefetch: number of entries read and decoded ahead on a background thread,
+        0 reads in the caller's thread
+    files: os.DirEntry or path list from an earlier walk of inpath, e.g.,
+        walk_tree(inpath)["files"]
 
-    return df, FileNotFoundError_list, df_fedata
+    Entries that are not FCE3/FCE4/FCE4M data are skipped.
+
+    for path, offset, size, version, mesh in iter_fce_entries("path/to/cars"):
+        print(path, offset, mesh.MNumParts)
+    """
+    it = _iter_fce_entries(inpath, decode, files)
+    if prefetch > 0:
+        return prefetch_iter(it, prefetch)
+    return it
 
 
 # main
-def fceanalyze_main(inpath: pathlib.Path, df_viv, path_json: pathlib.Path, opt_alwaysparseFCE: bool, opt_FCEondisk: bool):
-    if not pathlib.Path(path_json).exists() or opt_alwaysparseFCE:
+def get_fedata_path(path_json: pathlib.Path):
+    """ df_fedata is stored next to the FCE catalog, e.g., fce_files_fedata.json """
+    path_json = pathlib.Path(path_json)
+    return path_json.with_name(path_json.stem + "_fedata" + path_json.suffix)
+
+def fceanalyze_main(inpath: pathlib.Path, df_viv: pl.DataFrame | pl.LazyFrame, path_json: pathlib.Path, opt_alwaysparseFCE: bool, opt_FCEondisk: bool, jobs: int = 1, header_only: bool = False,
+                    opt_incremental: bool = False, tree: dict = None, opt_hash: bool = False):
+    """
+    jobs: number of worker processes for decoding, 0 uses all cores
+    header_only: fill mesh columns from FCE headers, skip mesh decoding
+    df_viv: VIV catalog. As LazyFrame (e.g., scl_dfutil.scandf()), filter and
+        column selection are pushed down into the reader.
+    path_json: catalog path, format by extension (.json, .parquet, .arrow)
+        df_fedata is stored alongside, see get_fedata_path()
+    opt_incremental: if catalog exists, decode only new or changed FCE entries
+        and drop rows of deleted ones. Takes precedence over opt_alwaysparseFCE.
+    tree, opt_hash: see fce_analyze()
+    """
+    path_fedata = get_fedata_path(path_json)
+
+    df_cache = None
+    df_fedata_cache = None
+    if opt_incremental and pathlib.Path(path_json).exists():
+        df_cache = scl_dfutil.readdf(path_json)
+        if not set(fce_schema).issubset(df_cache.columns):
+            df_cache = None  # written by older version, rebuild
+        elif path_fedata.exists():
+            df_fedata_cache = scl_dfutil.readdf(path_fedata)
+        opt_alwaysparseFCE = True
+
+    if scl_dfutil.needs_scan(path_json, opt_alwaysparseFCE, opt_incremental):
         # drop archives without any FCE files
-        df_viv = df_viv.with_columns(
-            has_fce=pl.col("files").list.eval(
+        df_viv = df_viv.lazy().filter(
+            (pl.col("count_dir_entries_true") > 0) &
+            pl.col("files").list.eval(
                 pl.element().str.to_lowercase().str.ends_with(".fce")
             ).list.any()
-        )
-        df_viv = df_viv.filter(
-            (pl.col("count_dir_entries_true") > 0) &
-            (pl.col("has_fce") == True)
-        ).drop("has_fce")
+        ).select(
+            ["path", "files", "files_offsets", "files_sizes", "validity_bitmap"]
+        ).collect()
 
         # analyze FCE files
-        df_fce, FileNotFoundError_list, df_fedata = fce_analyze(df_viv, opt_FCEondisk, inpath)
+        df_fce, FileNotFoundError_list, df_fedata = fce_analyze(df_viv, opt_FCEondisk, inpath, jobs, header_only, df_cache, df_fedata_cache, tree, opt_hash)
 
         if CONFIG["dev_clean_paths"]:
             df_fce = df_fce.with_columns(
@@ -348,10 +950,22 @@ def fceanalyze_main(inpath: pathlib.Path, df_viv, path_json: pathlib.Path, opt_a
                 .map_elements(lambda x: ".../" + pathlib.Path(x).name, return_dtype=str)
                 .alias("path"),
             )
-
-        scl_dfutil.writejson(df_fce, path_json)
+            if "path" in df_fedata.columns:
+                df_fedata = df_fedata.with_columns(
+                    pl.col("path")
+                    .map_elements(lambda x: ".../" + pathlib.Path(x).name, return_dtype=str)
+                    .alias("path"),
+                )
+
+        scl_dfutil.writedf(df_fce, path_json)
+        if df_fedata.width > 0:
+            scl_dfutil.writedf(df_fedata, path_fedata)
+        else:
+            path_fedata.unlink(missing_ok=True)
     else:
-        df_fce = pl.read_json(path_json)
+        df_fce = scl_dfutil.readdf(path_json)
         df_fedata = None
+        if path_fedata.exists():
+            df_fedata = scl_dfutil.readdf(path_fedata)
 
-    return df_fce, df_fedata
\ No newline at end of file
+    return df_fce, df_fedata
@@ -22,6 +22,7 @@ HOMEPAGE
     https://github.com/bfut/PyScripts
 """
 
+import contextlib
 import os
 import pathlib
 
@@ -29,9 +30,16 @@ import polars as pl
 import unvivtool as uvt
 
 import scl_dfutil
+import scl_fsutil
+import scl_log
+import scl_perf
+import scl_pool
+import scl_refpack
 
 CONFIG = {
     "dev_clean_paths" : False  # default: False
+    , "opt_singlepass" : True  # if True, parse header once; only re-parse damaged archives
+    , "opt_prefilter" : True  # if True, skip files without BIG magic or RefPack signature
 }
 
 min_unvivtool_version = "3.1"
@@ -39,7 +47,102 @@ if uvt.__version__ < min_unvivtool_version:
     print(f"Error: unvivtool version {uvt.__version__} is less than {min_unvivtool_version}. Please install latest unvivtool version.")
     raise ImportError
 
+viv_formats = ["BIGF", "BIGH", "BIG4", "REFPACK_BIGF", "REFPACK_BIGH", "REFPACK_BIG4"]
+
+viv_schema = {
+    "path": str,
+    "format": str,
+    "__state": int,
+    "size": int,
+    "size_true": int,
+    "mtime_ns": int,
+    "inode": int,
+    "count_dir_entries": int,
+    "count_dir_entries_true": int,
+    "header_size": int,
+    "header_size_true": int,
+    # "files": pl.List(pl.Binary),
+    "files": pl.List(str),
+    "files_offsets": pl.List(int),
+    "files_sizes": pl.List(int),
+    "files_fn_lens": pl.List(int),
+    "files_fn_ofs": pl.List(int),
+    "validity_bitmap": pl.List(int),
+}
+
+def has_viv_magic(path: pathlib.Path):
+    """
+    Return True if file starts with BIGF/BIGH/BIG4 magic or a RefPack signature.
+
+    Reads 4 bytes. Use to skip non-archives before calling into unvivtool.
+    """
+    try:
+        with scl_perf.stage("prefilter", nbytes=4), open(path, "rb") as f:
+            buf = f.read(4)
+    except OSError:
+        return False
+    if buf in (b"BIGF", b"BIGH", b"BIG4"):
+        return True
+    return scl_refpack.is_refpack(buf)
+
+def probe_viv_info(path: pathlib.Path, verbose=False):
+    """
+    Single-pass variant of get_viv_info(). Same return values.
+
+    The header is parsed once. If that parse is complete (every directory
+    entry listed in the header is valid), the hex-name view is derived from it,
+    the invalid-entry view equals it, and the fixed-dirent-length view is
+    skipped (a variable-length directory that parses completely cannot also
+    parse as 80-byte entries). Only damaged archives are parsed again in the
+    other modes.
+    """
+    ret = None
+    retx = None
+    retLEN = None
+    retINV = None
+
+    FileNotFoundError_ = None
+
+    if not os.access(path, os.R_OK):
+        return FileNotFoundError_, ret, retx, retLEN, retINV
+
+    try:
+        ret = uvt.get_info(path, verbose=verbose)
+    except Exception:
+        FileNotFoundError_ = str(path)
+
+    if ret is None or ret.get("format") is None:
+        return FileNotFoundError_, ret, retx, retLEN, retINV
+
+    if ret.get("count_dir_entries") == ret.get("count_dir_entries_true"):
+        retx = dict(ret)
+        retx.update({"files": [f.encode().hex() for f in ret.get("files", [])]})
+        retINV = ret
+        return FileNotFoundError_, ret, retx, retLEN, retINV
+
+    # damaged directory: re-parse in the remaining modes
+    try:
+        retx = uvt.get_info(path, fnhex=True, verbose=verbose)
+        retLEN = uvt.get_info(path, direnlen=80, verbose=verbose)
+        retINV = uvt.get_info(path, invalid=True, verbose=verbose)
+    except Exception:
+        FileNotFoundError_ = str(path)
+
+    if retx is not None:
+        files_bytes = retx.get("files", [])
+        files_bytes = scl_dfutil.byteslist2hex(files_bytes)
+        retx.update({"files": files_bytes})
+    if retLEN is not None:
+        files_bytes = retLEN.get("files", [])
+        files_bytes = scl_dfutil.byteslist2hex(files_bytes)
+        retLEN.update({"files": files_bytes})
+
+    return FileNotFoundError_, ret, retx, retLEN, retINV
+
 def get_viv_info(path: pathlib.Path, verbose=False):
+    if CONFIG["opt_singlepass"]:
+        return probe_viv_info(path, verbose)
+
     ret = None
     retx = None
     retLEN = None
@@ -95,122 +198,303 @@ def get_viv_info(path: pathlib.Path, verbose=False):
 
     return FileNotFoundError_, ret, retx, retLEN, retINV
 
-def build_tdf(filepath: pathlib.Path, ret):
-    tdf = pl.DataFrame(
-        {
-            "path": [filepath.as_posix()],
-            "format": [ret.get("format", None)],
-            "__state": [ret.get("__state", None)],
-            "size": [ret.get("size", None)],
-            "size_true": [filepath.stat().st_size],
-            "count_dir_entries": [ret.get("count_dir_entries", None)],
-            "count_dir_entries_true": [ret.get("count_dir_entries_true", None)],
-            "header_size": [ret.get("header_size", None)],
-            "header_size_true": [ret.get("header_size_true", None)],
-            "files": [ ret.get("files") ],
-            # "files": [ ret.get("files", None) ],  # this works
-            "files_offsets": [ ret.get("files_offsets", None) ],
-            "files_sizes": [ ret.get("files_sizes", None) ],
-            "files_fn_lens": [ ret.get("files_fn_lens", None) ],
-            "files_fn_ofs": [ ret.get("files_fn_ofs", None) ],
-            "validity_bitmap": [ ret.get("validity_bitmap", None) ],
-        }
-    )
-    return tdf
-
-def viv_analyze(inpath: pathlib.Path):
-    df = pl.DataFrame(
-        schema={
-            "path": str,
-            "format": str,
-            "__state": int,
-            "size": int,
-            "size_true": int,
-            "count_dir_entries": int,
-            "count_dir_entries_true": int,
-            "header_size": int,
-            "header_size_true": int,
-            # "files": pl.List(pl.Binary),
-            "files": pl.List(str),
-            "files_offsets": pl.List(int),
-            "files_sizes": pl.List(int),
-            "files_fn_lens": pl.List(int),
-            "files_fn_ofs": pl.List(int),
-            "validity_bitmap": pl.List(int),
-        }
-    )
-    print(df)
+def get_refpack_viv_info(path: pathlib.Path, verbose=False):
+    """
+    get_viv_info() for RefPack compressed archives the installed unvivtool
+    cannot read: the decompressed file from scl_refpack.CACHE is probed, and
+    formats are reported as "REFPACK_" + format. Offsets refer to the
+    decompressed archive, as scl_refpack.CACHE.get_buf_at() does.
+
+    Returns None if path is not RefPack compressed.
+    """
+    try:
+        tmppath = scl_refpack.CACHE.get_path(path)
+    except (OSError, ValueError, IndexError):  # unreadable or damaged stream
+        return None
+    if tmppath is None:
+        return None
+    FileNotFoundError_, *rets = get_viv_info(tmppath, verbose)
+    for ret in {id(ret): ret for ret in rets if ret is not None}.values():
+        if ret.get("format") in ["BIGF", "BIGH", "BIG4"]:
+            ret["format"] = "REFPACK_" + ret["format"]
+    return (str(path) if FileNotFoundError_ is not None else None), *rets
+
+def build_row(filepath: pathlib.Path, ret):
+    st = filepath.stat()
+    row = {
+        "path": filepath.as_posix(),
+        "format": ret.get("format", None),
+        "__state": ret.get("__state", None),
+        "size": ret.get("size", None),
+        "size_true": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "inode": st.st_ino,
+        "count_dir_entries": ret.get("count_dir_entries", None),
+        "count_dir_entries_true": ret.get("count_dir_entries_true", None),
+        "header_size": ret.get("header_size", None),
+        "header_size_true": ret.get("header_size_true", None),
+        "files": ret.get("files"),
+        # "files": ret.get("files", None),  # this works
+        "files_offsets": ret.get("files_offsets", None),
+        "files_sizes": ret.get("files_sizes", None),
+        "files_fn_lens": ret.get("files_fn_lens", None),
+        "files_fn_ofs": ret.get("files_fn_ofs", None),
+        "validity_bitmap": ret.get("validity_bitmap", None),
+    }
+    return row
+
+def analyze_viv_file(filepath: pathlib.Path):
+    """
+    Probe one file. Return (FileNotFoundError_, row), row is None for non-archives.
+
+    Module-level so it can be dispatched to worker processes.
+    """
+    scl_log.log.debug("%s", filepath)
+
+    with scl_perf.stage("viv_probe"):
+        e_, ret, retx, retLEN, retINV = get_viv_info(filepath)
+        if ret is None or ret.get("format") is None:
+            ret_refpack = get_refpack_viv_info(filepath)
+            if ret_refpack is not None:
+                e_, ret, retx, retLEN, retINV = ret_refpack
+    if ret is None: ret = retx
+    if ret is None: ret = retLEN
+    if ret is None:
+        return e_, None
+    scl_log.log.debug("%s", ret)
+    if ret.get("format") not in viv_formats:
+        return e_, None
+
+    if retLEN is not None and retLEN.get("count_dir_entries_true") > 0 and retLEN.get("count_dir_entries") <= retLEN.get("count_dir_entries_true"):
+        return e_, build_row(filepath, retLEN)
+    return e_, build_row(filepath, ret)
+
+def viv_analyze(inpath: pathlib.Path, jobs: int = 1, df_cache: pl.DataFrame = None, sink = None, files: list = None):
+    """
+    jobs: number of worker processes for probing archives, 0 uses all cores.
+        If serial, headers of upcoming files are hinted to the OS on I/O
+        threads, see scl_fsutil.readahead().
+    df_cache: previous result. Rows whose (path, size_true, mtime_ns, inode)
+        match the file on disk are reused instead of re-probed. Rows for files
+        that no longer exist are dropped.
+    sink: open text file. If given, each new row is appended as NDJSON record
+        as soon as it is probed and not kept in memory; returned df is None.
+        Reused df_cache rows are assumed to be in the sink already, so
+        df_cache needs only the path and file identity columns.
+    files: os.DirEntry list from an earlier walk of inpath, e.g.,
+        scl_libfceanalyze.walk_tree(); if given, inpath is not walked again
+    """
+    # accumulate column-wise, build DataFrame once
+    cols = {k: [] for k in viv_schema}
 
     inpath_ = pathlib.Path(inpath)
 
+    cache = {}
+    if df_cache is not None:
+        if sink is None:
+            df_cache = df_cache.select(list(viv_schema)).cast(viv_schema)
+            cache_cols = df_cache.to_dict(as_series=False)
+        for i, (path, size_true, mtime_ns, inode) in enumerate(df_cache.select("path", "size_true", "mtime_ns", "inode").iter_rows()):
+            cache[path] = (i, (size_true, mtime_ns, inode))
+
     FileNotFoundError_list = []
     counter = 0
     if inpath_.is_file():
         # print(inpath_)
-        e_, ret, retx, retLEN = None, None, None, None
-        e_, ret, retx, retLEN = get_viv_info(inpath_)
+        e_, ret, retx, retLEN, retINV = get_viv_info(inpath_)
         if e_ is not None: FileNotFoundError_list.append(e_)
         if ret is None: ret = retx
         if ret is None: ret = retLEN
         # print(ret)
-        if ret.get("format") in ["BIGF", "BIGH", "BIG4", "REFPACK_BIGF", "REFPACK_BIGH", "REFPACK_BIG4"]:
+        if ret.get("format") in viv_formats:
             pass
-        #     tdf = build_tdf(pathlib.Path(inpath_).resolve(), ret)
-        #     print(tdf)
-        #     df = df.vstack(tdf)
+        #     row = build_row(pathlib.Path(inpath_).resolve(), ret)
+        #     for k in cols: cols[k].append(row[k])
 
     if inpath_.is_dir():
-        for subdir, dirs, files in os.walk(inpath_):
-            for file in files:
-                b = str(file).isprintable()
-                if not b:
+        filepaths = []
+        for entry in scl_fsutil.walk_files(inpath_) if files is None else files:
+            filepath = pathlib.Path(entry.path)
+
+            # # Skip if filepath is in list
+            # skip = filepath.as_posix() in [
+            #     # uvt.get_info(path)
+            #     # 'path/to/file',
+            #     ]
+            # print(f"skip: {skip}", filepath.as_posix())
+            # if skip:
+            #     continue
+            # reuse unchanged archives
+            cached = cache.get(filepath.as_posix())
+            if cached is not None:
+                st = entry.stat()
+                # DirEntry.stat() reports st_ino 0 on Windows, inode() does not
+                if cached[1] == (st.st_size, st.st_mtime_ns, entry.inode()):
+                    filepaths.append((filepath, cached[0]))
                     continue
-                filepath = (pathlib.Path(subdir) / file)
-
-                # # Skip if filepath is in list
-                # skip = filepath.as_posix() in [
-                #     # uvt.get_info(path)
-                #     # 'path/to/file',
-                #     ]
-                # print(f"skip: {skip}", filepath.as_posix())
-                # if skip:
-                #     continue
-                print(filepath)
-
-                e_, ret, retx, retLEN, retINV = get_viv_info(filepath)
-                if e_ is not None: FileNotFoundError_list.append(e_)
-                if ret is None: ret = retx
-                if ret is None: ret = retLEN
-                # continue
-                if ret is None:
+            filepaths.append((filepath, None))
+
+        # the prefilter hints the first page of every file, the probe hints
+        # archive headers of files that passed
+        def get_hints(filepath, size=None):
+            return [(filepath, [(0, scl_fsutil.CONFIG["readahead_header"] if size is None else size)])]
+
+        if CONFIG["opt_prefilter"]:
+            filepaths = [
+                (filepath, i) for filepath, i in scl_fsutil.readahead(
+                    filepaths, lambda x: get_hints(x[0], scl_fsutil.CONFIG["readahead_magic"]) if x[1] is None else []
+                )
+                if i is not None or has_viv_magic(filepath)
+            ]
+
+        probepaths = [filepath for filepath, i in filepaths if i is None]
+        parallel = jobs != 1 and len(probepaths) > 1
+        max_workers = jobs if jobs > 0 else os.cpu_count()
+        with scl_pool.process_pool(max_workers) if parallel else contextlib.nullcontext() as executor:
+            if parallel:
+                # Executor.map() yields in submission order, rows keep walk order
+                chunksize = max(1, len(probepaths) // (max_workers * 16))
+                if scl_perf.CONFIG["enabled"]:
+                    results = scl_perf.merged(executor.map(scl_perf.collect(analyze_viv_file), probepaths, chunksize=chunksize))
+                else:
+                    results = executor.map(analyze_viv_file, probepaths, chunksize=chunksize)
+            else:
+                results = map(analyze_viv_file, scl_fsutil.readahead(probepaths, get_hints))
+
+            progress = scl_log.Progress("viv", total=len(filepaths))
+            for filepath, i in filepaths:
+                if i is not None:
+                    progress.update()
+                    counter += 1
+                    if sink is None:
+                        for k in cols: cols[k].append(cache_cols[k][i])
                     continue
-                # if retx is None:
-                #     continue
-                print(ret)
-                if ret.get("format") not in ["BIGF", "BIGH", "BIG4", "REFPACK_BIGF", "REFPACK_BIGH", "REFPACK_BIG4"]:
+                e_, row = next(results)
+                if e_ is not None: FileNotFoundError_list.append(e_)
+                if row is None:
+                    progress.update()
                     continue
+                progress.update(nbytes=row["size_true"])
                 counter += 1
-
-                tdf = None
-                tdfx = None
-                tdfLEN = None
-                if ret is not None: tdf = build_tdf(filepath, ret)
-                if retx is not None: tdfx = build_tdf(filepath, retx)
-                if retLEN is not None: tdfLEN = build_tdf(filepath, retLEN)
-                if tdf is not None: print(tdf)
-
-                if tdfLEN is not None and tdfLEN.item(0, "count_dir_entries_true") > 0 and tdfLEN.item(0, "count_dir_entries") <= tdfLEN.item(0, "count_dir_entries_true"):
-                    df = df.vstack(tdfLEN)
+                if sink is not None:
+                    scl_dfutil.appendndjson(row, sink)
                     continue
-                df = df.vstack(tdf)
+                for k in cols: cols[k].append(row[k])
+            progress.close()
 
+    if sink is not None:
+        return None, FileNotFoundError_list, counter
+    with scl_perf.stage("dataframe"):
+        df = pl.DataFrame(cols, schema=viv_schema)
     return df, FileNotFoundError_list, counter
 
+def compact_ndjson_catalog(path_json: pathlib.Path):
+    """
+    Drop records of deleted or changed files from a resumed NDJSON catalog.
+
+    A changed file has its stale record followed by a fresh one; only records
+    whose (size_true, mtime_ns, inode) still match the file on disk are kept.
+    """
+    lf = scl_dfutil.scandf(path_json, viv_schema).with_row_index("__row")
+    keep = []
+    for row, path, size_true, mtime_ns, inode in lf.select("__row", "path", "size_true", "mtime_ns", "inode").collect().iter_rows():
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if (st.st_size, st.st_mtime_ns, st.st_ino) == (size_true, mtime_ns, inode):
+            keep.append(row)
+    tmppath = pathlib.Path(path_json).with_name(pathlib.Path(path_json).name + ".tmp")
+    lf.filter(pl.col("__row").is_in(keep)).drop("__row").sink_ndjson(tmppath)
+    os.replace(tmppath, path_json)
+
+
+# entry index
+def build_entries(df_viv: pl.DataFrame | pl.LazyFrame):
+    """
+    Explode VIV catalog into one row per archive entry.
+
+    Columns: archive_id (row index in df_viv), path, entry_id (index in
+    archive), file (name as stored), name (lowercase), ext (lowercase, with
+    dot), offset, size, flags (validity, 1 if not in catalog).
+    """
+    lf = df_viv.lazy().with_row_index("archive_id")
+    if "validity_bitmap" in lf.collect_schema().names():
+        flags = pl.when(
+            pl.col("validity_bitmap").list.len() == pl.col("files").list.len()
+        ).then(pl.col("validity_bitmap")).otherwise(
+            pl.col("files_offsets").list.eval(pl.element() * 0 + 1)
+        )
+    else:
+        flags = pl.col("files_offsets").list.eval(pl.element() * 0 + 1)
+    df_entries = lf.select(
+        "archive_id",
+        "path",
+        pl.int_ranges(pl.col("files").list.len()).alias("entry_id"),
+        pl.col("files").alias("file"),
+        pl.col("files_offsets").alias("offset"),
+        pl.col("files_sizes").alias("size"),
+        flags.alias("flags"),
+    ).explode(
+        ["entry_id", "file", "offset", "size", "flags"]
+    ).drop_nulls("file").with_columns(
+        name=pl.col("file").str.to_lowercase(),
+    ).with_columns(
+        ext=pl.col("name").str.extract(r"(\.[^./\\]*)$").fill_null(""),
+    ).select(
+        "archive_id", "path", "entry_id", "file", "name", "ext", "offset", "size", "flags"
+    ).collect()
+    return df_entries
+
+def find_entries(df_entries: pl.DataFrame, names: list = None, exts: list = None):
+    """
+    Select entries by lowercase name and/or extension (hash lookup).
+
+    Example: find_entries(df_entries, exts=[".fce"])
+    """
+    mask = pl.lit(True)
+    if names is not None:
+        mask = mask & pl.col("name").is_in([n.lower() for n in names])
+    if exts is not None:
+        mask = mask & pl.col("ext").is_in([e.lower() for e in exts])
+    return df_entries.filter(mask)
+
 
 # main
-def vivanalyze_main(path_json: pathlib.Path, inpath: pathlib.Path, opt_alwaysparseVIV: bool):
-    if not pathlib.Path(path_json).exists() or opt_alwaysparseVIV:
-        df_viv, FileNotFoundError_list, counter = viv_analyze(inpath)
+def vivanalyze_main(path_json: pathlib.Path, inpath: pathlib.Path, opt_alwaysparseVIV: bool, jobs: int = 1, opt_incremental: bool = False, lazy: bool = False, files: list = None):
+    """
+    path_json: catalog path, format by extension (.json, .parquet, .arrow, .ndjson)
+        NDJSON catalogs are written while scanning, one record per archive.
+    opt_incremental: if catalog exists, re-probe only new or changed files and
+        drop rows of deleted files. Takes precedence over opt_alwaysparseVIV.
+        For NDJSON, this resumes an interrupted scan.
+    lazy: if catalog is reused as-is or NDJSON, return it as LazyFrame
+    files: see viv_analyze()
+    """
+    if scl_dfutil.get_format(path_json) == "ndjson" and scl_dfutil.needs_scan(path_json, opt_alwaysparseVIV, opt_incremental):
+        df_cache = None
+        if opt_incremental and pathlib.Path(path_json).exists():
+            scl_dfutil.repairndjson(path_json)
+            df_cache = scl_dfutil.scandf(path_json, viv_schema).select("path", "size_true", "mtime_ns", "inode").collect()
+        with open(path_json, "a" if df_cache is not None else "w", encoding="utf-8") as sink:
+            _, FileNotFoundError_list, counter = viv_analyze(inpath, jobs, df_cache, sink, files)
+        if df_cache is not None:
+            compact_ndjson_catalog(path_json)
+
+        df_viv = scl_dfutil.scandf(path_json, viv_schema)
+        if not lazy:
+            df_viv = df_viv.collect()
+        return df_viv, FileNotFoundError_list, counter
+
+    df_cache = None
+    if opt_incremental and pathlib.Path(path_json).exists():
+        df_cache = scl_dfutil.readdf(path_json)
+        if not {"path", "size_true", "mtime_ns", "inode"}.issubset(df_cache.columns):
+            df_cache = None  # written by older version, rescan
+        opt_alwaysparseVIV = True
+
+    if scl_dfutil.needs_scan(path_json, opt_alwaysparseVIV, opt_incremental):
+        df_viv, FileNotFoundError_list, counter = viv_analyze(inpath, jobs, df_cache, files=files)
 
         if CONFIG["dev_clean_paths"]:
             df_viv = df_viv.with_columns(
@@ -219,9 +503,13 @@ def vivanalyze_main(path_json: pathlib.Path, inpath: pathlib.Path, opt_alwayspar
                 .alias("path"),
             )
 
-        scl_dfutil.writejson(df_viv, path_json)
+        scl_dfutil.writedf(df_viv, path_json)
+    elif lazy:
+        df_viv = scl_dfutil.scandf(path_json)
+        FileNotFoundError_list = []
+        counter = df_viv.select(pl.len()).collect().item()
     else:
-        df_viv = pl.read_json(path_json)
+        df_viv = scl_dfutil.readdf(path_json)
         FileNotFoundError_list = []
         counter = df_viv.shape[0]
 
@@ -0,0 +1,136 @@
+# Copyright (C) 2024 and later Benjamin Futasz <https://github.com/bfut>
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the authors be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+"""
+scl_log.py - Python library
+
+Logging for the scanners, on stderr. Levels:
+    quiet     warnings and errors only
+    progress  periodic progress line with rate and ETA (default)
+    debug     progress, plus one line per file / FCE entry
+
+    scl_log.set_level("debug")
+    scl_log.log.debug("%s", path)
+    with scl_log.Progress("viv", total=len(paths)) as progress:
+        for path in paths:
+            ...
+            progress.update(nbytes=size)
+
+HOMEPAGE
+    https://github.com/bfut/PyScripts
+"""
+
+import datetime
+import logging
+import sys
+import time
+
+CONFIG = {
+    "level" : "progress"  # "quiet", "progress" or "debug"
+    , "interval" : 2.0  # seconds between progress lines
+}
+
+levels = {
+    "quiet": logging.WARNING,
+    "progress": logging.INFO,
+    "debug": logging.DEBUG,
+}
+
+log = logging.getLogger("VivFceAnalyze")
+if not log.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_handler)
+    log.propagate = False
+
+def set_level(level: str):
+    if level not in levels:
+        raise ValueError(f"unknown log level '{level}', expected one of {list(levels)}")
+    CONFIG["level"] = level
+    log.setLevel(levels[level])
+
+set_level(CONFIG["level"])
+
+
+def format_eta(seconds: float):
+    if seconds is None:
+        return "?"
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+class Progress:
+    """
+    Periodic progress line: done/total, percent, rate, MB/s and ETA. Printed
+    at most every CONFIG["interval"] seconds and once on close(). Silent in
+    quiet mode. On a terminal the line is rewritten in place, unless debug
+    lines are interleaved.
+    """
+    def __init__(self, desc: str, total: int = None, unit: str = "files"):
+        self.desc = desc
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.nbytes = 0
+        self.enabled = log.isEnabledFor(logging.INFO)
+        self.inplace = sys.stderr.isatty() and not log.isEnabledFor(logging.DEBUG)
+        self.t0 = time.monotonic()
+        self.t_last = self.t0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, n: int = 1, nbytes: int = 0):
+        self.done += n
+        self.nbytes += nbytes
+        if not self.enabled:
+            return
+        t = time.monotonic()
+        if t - self.t_last >= CONFIG["interval"]:
+            self.t_last = t
+            self._print(t)
+
+    def line(self, t: float = None, final: bool = False):
+        t = time.monotonic() if t is None else t
+        elapsed = max(t - self.t0, 1e-9)
+        rate = self.done / elapsed
+        s = f"{self.desc}: {self.done}"
+        if self.total is not None:
+            s += f"/{self.total}"
+            if self.total > 0:
+                s += f" ({100 * self.done / self.total:.1f}%)"
+        s += f" {self.unit}, {rate:.1f} {self.unit}/s"
+        if self.nbytes > 0:
+            s += f", {self.nbytes / 1e6 / elapsed:.1f} MB/s"
+        if final or self.total is None:
+            s += f", {format_eta(elapsed)} elapsed"
+        else:
+            s += f", ETA {format_eta((self.total - self.done) / rate if rate > 0 else None)}"
+        return s
+
+    def _print(self, t: float = None, final: bool = False):
+        if self.inplace:
+            sys.stderr.write("\r" + self.line(t, final) + "\x1b[K" + ("\n" if final else ""))
+            sys.stderr.flush()
+        else:
+            log.info(self.line(t, final))
+
+    def close(self):
+        if self.enabled and self.total != 0:
+            self._print(final=True)
+        self.enabled = False
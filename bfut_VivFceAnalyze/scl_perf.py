@@ -0,0 +1,157 @@
+# Copyright (C) 2024 and later Benjamin Futasz <https://github.com/bfut>
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the authors be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+"""
+scl_perf.py - Python library
+
+Per-stage timing: cumulative seconds, call counts and bytes per stage name.
+Disabled by default, then stage() costs one dict lookup.
+
+    scl_perf.enable()
+    with scl_perf.stage("decode", nbytes=len(buf)):
+        ...
+    scl_perf.print_summary()
+
+Stages timed in worker processes are collected with collect() / merged(),
+their seconds add up across processes.
+
+HOMEPAGE
+    https://github.com/bfut/PyScripts
+"""
+
+import json
+import time
+
+import polars as pl
+
+CONFIG = {
+    "enabled" : False
+}
+
+_stats = {}  # key: stage name, value: [seconds, count, nbytes]
+_t_start = None
+
+
+def enable():
+    global _t_start
+    CONFIG["enabled"] = True
+    _t_start = time.perf_counter()
+
+def add(name: str, seconds: float, count: int = 1, nbytes: int = 0):
+    s = _stats.get(name)
+    if s is None:
+        s = _stats[name] = [0.0, 0, 0]
+    s[0] += seconds
+    s[1] += count
+    s[2] += nbytes
+
+class stage:
+    """
+    Context manager, times the block under name. count and nbytes may be set
+    on the returned object inside the block.
+    """
+    __slots__ = ("name", "count", "nbytes", "t0")
+
+    def __init__(self, name: str, count: int = 1, nbytes: int = 0):
+        self.name = name
+        self.count = count
+        self.nbytes = nbytes
+        self.t0 = None
+
+    def __enter__(self):
+        if CONFIG["enabled"]:
+            self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.t0 is not None:
+            add(self.name, time.perf_counter() - self.t0, self.count, self.nbytes)
+
+
+# worker processes
+def reset():
+    _stats.clear()
+
+def snapshot():
+    return {k: list(v) for k, v in _stats.items()}
+
+def merge(stats: dict):
+    for k, (seconds, count, nbytes) in stats.items():
+        add(k, seconds, count, nbytes)
+
+class collect:
+    """
+    Picklable wrapper for pool tasks, returns (func result, stage stats of
+    this call).
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args):
+        reset()  # stats of earlier tasks in this worker
+        ret = self.func(*args)
+        return ret, snapshot()
+
+def merged(results):
+    """ Unwrap collect() results, merge their stats """
+    for ret, stats in results:
+        merge(stats)
+        yield ret
+
+
+# report
+def summary(wall: float = None):
+    """
+    Return pl.DataFrame with one row per stage, sorted by seconds. wall
+    defaults to the time since enable().
+    """
+    if wall is None:
+        wall = time.perf_counter() - _t_start if _t_start is not None else 0.0
+    rows = []
+    for name, (seconds, count, nbytes) in _stats.items():
+        rows.append({
+            "stage": name,
+            "seconds": seconds,
+            "count": count,
+            "MB": nbytes / 1e6,
+            "count_per_s": count / seconds if seconds > 0 else None,
+            "MB_per_s": nbytes / 1e6 / seconds if seconds > 0 and nbytes > 0 else None,
+            "pct_wall": 100 * seconds / wall if wall > 0 else None,
+        })
+    schema = {
+        "stage": str,
+        "seconds": float,
+        "count": int,
+        "MB": float,
+        "count_per_s": float,
+        "MB_per_s": float,
+        "pct_wall": float,
+    }
+    return pl.DataFrame(rows, schema=schema).sort("seconds", descending=True)
+
+def print_summary(wall: float = None):
+    if wall is None:
+        wall = time.perf_counter() - _t_start if _t_start is not None else 0.0
+    with pl.Config(tbl_rows=-1, tbl_cols=-1, float_precision=3):
+        print(summary(wall))
+    print(f"wall: {wall:.3f} s")
+
+def write_json(path, wall: float = None):
+    if wall is None:
+        wall = time.perf_counter() - _t_start if _t_start is not None else 0.0
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"wall": wall, "stages": summary(wall).to_dicts()}, f, indent=2)
@@ -0,0 +1,67 @@
+# Copyright (C) 2024 and later Benjamin Futasz <https://github.com/bfut>
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the authors be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+"""
+scl_pool.py - Python library
+
+Worker process pools for the scanners. Workers are started with "spawn"
+(or "forkserver"), never forked: polars' thread pool may deadlock in forked
+children. Spawned workers import modules afresh, so the CONFIG dicts of
+config_modules are copied from the parent when each worker starts.
+
+    with scl_pool.process_pool(max_workers=4) as executor:
+        results = executor.map(func, items)
+
+Scripts using pools must parse arguments and configure inside main(), as
+spawn imports the main module again in each worker.
+
+HOMEPAGE
+    https://github.com/bfut/PyScripts
+"""
+
+import concurrent.futures
+import importlib
+import multiprocessing
+import sys
+
+import scl_log
+
+CONFIG = {
+    "start_method" : "spawn"  # "spawn" or "forkserver" (not on Windows)
+}
+
+# modules whose CONFIG is copied to workers, if loaded in the parent
+config_modules = ["scl_fsutil", "scl_libfceanalyze", "scl_libvivanalyze", "scl_log", "scl_perf", "scl_refpack"]
+
+def get_worker_state():
+    """ Return dict, key: module name, value: copy of its CONFIG """
+    return {name: dict(sys.modules[name].CONFIG) for name in config_modules if name in sys.modules}
+
+def init_worker(state: dict):
+    """ Pool initializer, apply get_worker_state() of the parent """
+    for name, config in state.items():
+        importlib.import_module(name).CONFIG.update(config)
+    scl_log.set_level(scl_log.CONFIG["level"])
+
+def process_pool(max_workers: int):
+    """ Return ProcessPoolExecutor whose workers start with the parent's CONFIG state """
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context(CONFIG["start_method"]),
+        initializer=init_worker,
+        initargs=(get_worker_state(),),
+    )
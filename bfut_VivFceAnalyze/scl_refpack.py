@@ -0,0 +1,231 @@
+# Copyright (C) 2024 and later Benjamin Futasz <https://github.com/bfut>
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the authors be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+"""
+scl_refpack.py - Python library
+
+Decompress RefPack (0x10FB) wrapped archives once, serve entry buffers from
+a size-bounded, memory-mapped temp file cache with LRU eviction.
+
+HOMEPAGE
+    https://github.com/bfut/PyScripts
+"""
+
+import atexit
+import collections
+import mmap
+import multiprocessing.util
+import os
+import pathlib
+import shutil
+import tempfile
+
+import scl_perf
+from bfut_mywrappers import GetBufRange
+
+CONFIG = {
+    "cache_max_bytes" : 512 * 1024 * 1024  # decompressed bytes kept on disk
+}
+
+def is_refpack(buf: bytes):
+    """ RefPack signature 0x10FB, flag bits 0x01 and 0x80 may be set """
+    return len(buf) >= 2 and buf[0] & 0x7E == 0x10 and buf[1] == 0xFB
+
+def refpack_decompress(buf: bytes):
+    """
+    Return decompressed RefPack (QFS) stream.
+
+    Header: 2 bytes signature (flags 0x01: compressed size field present,
+    0x80: 4-byte size fields), then big-endian decompressed size.
+    """
+    if not is_refpack(buf):
+        raise ValueError("not a RefPack stream")
+    sz_len = 4 if buf[0] & 0x80 else 3
+    p = 2
+    if buf[0] & 0x01:
+        p += sz_len
+    outsize = int.from_bytes(buf[p:p+sz_len], "big")
+    p += sz_len
+
+    out = bytearray(outsize)
+    o = 0
+    n = len(buf)
+    while p < n:
+        b0 = buf[p]
+        if b0 < 0x80:
+            b1 = buf[p+1]
+            p += 2
+            plain = b0 & 0x03
+            copy_len = ((b0 & 0x1C) >> 2) + 3
+            copy_ofs = ((b0 & 0x60) << 3) + b1 + 1
+        elif b0 < 0xC0:
+            b1, b2 = buf[p+1], buf[p+2]
+            p += 3
+            plain = (b1 >> 6) & 0x03
+            copy_len = (b0 & 0x3F) + 4
+            copy_ofs = ((b1 & 0x3F) << 8) + b2 + 1
+        elif b0 < 0xE0:
+            b1, b2, b3 = buf[p+1], buf[p+2], buf[p+3]
+            p += 4
+            plain = b0 & 0x03
+            copy_len = ((b0 & 0x0C) << 6) + b3 + 5
+            copy_ofs = ((b0 & 0x10) << 12) + (b1 << 8) + b2 + 1
+        elif b0 < 0xFC:
+            p += 1
+            plain = ((b0 & 0x1F) << 2) + 4
+            copy_len = 0
+            copy_ofs = 0
+        else:
+            p += 1
+            plain = b0 & 0x03
+            copy_len = 0
+            copy_ofs = 0
+
+        if o + plain + copy_len > outsize or p + plain > n:
+            raise ValueError("RefPack stream overflow")
+        out[o:o+plain] = buf[p:p+plain]
+        p += plain
+        o += plain
+
+        if copy_len > 0:
+            src = o - copy_ofs
+            if src < 0:
+                raise ValueError("RefPack back-reference out of bounds")
+            if copy_ofs >= copy_len:
+                out[o:o+copy_len] = out[src:src+copy_len]
+            else:
+                for i in range(copy_len):  # overlapping run
+                    out[o+i] = out[src+i]
+            o += copy_len
+
+        if b0 >= 0xFC:
+            break
+    return bytes(out[:o])
+
+
+class DecompressedArchiveCache:
+    """
+    Decompress each RefPack file once, keep the result in a temp file and
+    serve ranges from its memory map. Least recently used entries are evicted
+    once the total decompressed size exceeds max_bytes.
+
+    Entries are keyed on (path, size, mtime_ns), a changed file is
+    decompressed again.
+    """
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = CONFIG["cache_max_bytes"] if max_bytes is None else max_bytes
+        self.entries = collections.OrderedDict()  # key: (path, size, mtime_ns), value: (tmppath, mmap, nbytes)
+        self.nbytes = 0
+        self.tmpdir = None
+        self.pid = os.getpid()
+
+    def _check_pid(self):
+        if self.pid != os.getpid():  # forked child, temp files belong to parent
+            self.entries = collections.OrderedDict()
+            self.nbytes = 0
+            self.tmpdir = None
+            self.pid = os.getpid()
+
+    def _evict(self, key):
+        tmppath, mm, nbytes = self.entries.pop(key)
+        if isinstance(mm, mmap.mmap):
+            mm.close()
+        tmppath.unlink(missing_ok=True)
+        self.nbytes -= nbytes
+
+    def _load(self, path, key, f=None):
+        with scl_perf.stage("read", nbytes=key[1]):
+            if f is None:
+                buf = GetBufRange(path, 0, key[1])
+            else:
+                f.seek(0)
+                buf = f.read(key[1])
+        with scl_perf.stage("refpack", nbytes=key[1]):
+            buf = refpack_decompress(buf)
+        while self.entries and self.nbytes + len(buf) > self.max_bytes:
+            self._evict(next(iter(self.entries)))
+        if self.tmpdir is None:
+            self.tmpdir = pathlib.Path(tempfile.mkdtemp(prefix="scl_refpack_"))
+            # pool workers skip atexit, but run multiprocessing finalizers
+            multiprocessing.util.Finalize(self, self.clear, exitpriority=0)
+        fd, tmppath = tempfile.mkstemp(dir=self.tmpdir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(buf)
+        mm = b""
+        if len(buf) > 0:  # cannot map empty file
+            with open(tmppath, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.entries[key] = (pathlib.Path(tmppath), mm, len(buf))
+        self.nbytes += len(buf)
+
+    def get(self, path: pathlib.Path, f=None, st: os.stat_result = None):
+        """
+        Return decompressed file as read-only mmap, or None if file is not
+        RefPack compressed.
+
+        f, st: path already opened for binary reading by the caller and its
+            os.fstat() result; f is read from instead of opening path again
+        """
+        self._check_pid()
+        if st is None:
+            st = os.stat(path) if f is None else os.fstat(f.fileno())
+        key = (os.fspath(path), st.st_size, st.st_mtime_ns)
+        if key not in self.entries:
+            if f is None:
+                with open(path, "rb") as f_:
+                    head = f_.read(2)
+            else:
+                f.seek(0)
+                head = f.read(2)
+            if not is_refpack(head):
+                return None
+            self._load(path, key, f)
+        self.entries.move_to_end(key)
+        return self.entries[key][1]
+
+    def get_path(self, path: pathlib.Path):
+        """
+        Return path of the decompressed temp file, or None if file is not
+        RefPack compressed. Valid until the entry is evicted.
+        """
+        if self.get(path) is None:
+            return None
+        return next(reversed(self.entries.values()))[0]  # get() moved it to the end
+
+    def get_buf_at(self, path: pathlib.Path, start, end):
+        """
+        Like GetBufRange(), but offsets refer to the decompressed file if path
+        is RefPack compressed.
+        """
+        mm = self.get(path)
+        if mm is None:
+            with scl_perf.stage("read") as st:
+                buf = GetBufRange(path, start, end)
+                st.nbytes = len(buf)
+            return buf
+        return mm[start:end]
+
+    def clear(self):
+        self._check_pid()
+        for key in list(self.entries):
+            self._evict(key)
+        if self.tmpdir is not None:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+            self.tmpdir = None
+
+CACHE = DecompressedArchiveCache()
+atexit.register(CACHE.clear)
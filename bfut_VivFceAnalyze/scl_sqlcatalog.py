@@ -0,0 +1,285 @@
+# Copyright (C) 2024 and later Benjamin Futasz <https://github.com/bfut>
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the authors be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+"""
+scl_sqlcatalog.py - Python library
+
+SQLite catalog (stdlib sqlite3) of VIV and FCE scans in normalized, indexed
+tables, so single lookups do not load the whole JSON catalog.
+
+    archives  one row per VIV archive (df_viv)
+    entries   one row per archive entry, see scl_libvivanalyze.build_entries()
+    meshes    one row per FCE (df_fce), linked to archives by path
+    parts     one row per FCE part
+    fedata    one row per FCE with fedata (df_fedata)
+
+    write_catalog("catalog.sqlite", df_viv, df_fce, df_fedata)
+    con = connect("catalog.sqlite", readonly=True)
+    df = find_parts(con, ":HB", min_triags=5000)
+
+Column names follow the DataFrame catalogs. As there, meshes.size is the end
+offset of the FCE in its file.
+
+HOMEPAGE
+    https://github.com/bfut/PyScripts
+"""
+
+import contextlib
+import json
+import pathlib
+import sqlite3
+
+import polars as pl
+
+import scl_libvivanalyze
+import scl_perf
+
+schema_sql = """
+CREATE TABLE IF NOT EXISTS archives (
+    archive_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    format TEXT,
+    size INTEGER,
+    size_true INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    count_dir_entries INTEGER,
+    count_dir_entries_true INTEGER,
+    header_size INTEGER
+);
+CREATE TABLE IF NOT EXISTS entries (
+    archive_id INTEGER NOT NULL,
+    entry_id INTEGER NOT NULL,
+    file TEXT,
+    name TEXT,
+    ext TEXT,
+    offset INTEGER,
+    size INTEGER,
+    flags INTEGER,
+    PRIMARY KEY (archive_id, entry_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meshes (
+    mesh_id INTEGER PRIMARY KEY,
+    car_name TEXT COLLATE NOCASE,
+    path TEXT NOT NULL,
+    format TEXT,
+    offset INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER,
+    hash TEXT,
+    name TEXT,
+    version INTEGER,
+    MNumParts INTEGER,
+    MNumTriags INTEGER,
+    MNumVerts INTEGER,
+    MNumArts INTEGER,
+    MUnknown3 INTEGER,
+    NumColors INTEGER,
+    NumDummies INTEGER
+);
+CREATE TABLE IF NOT EXISTS parts (
+    mesh_id INTEGER NOT NULL,
+    part_id INTEGER NOT NULL,
+    name TEXT,
+    x REAL,
+    y REAL,
+    z REAL,
+    PNumTriags INTEGER,
+    PNumVerts INTEGER,
+    PRIMARY KEY (mesh_id, part_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fedata (
+    mesh_id INTEGER NOT NULL,
+    version INTEGER,
+    id TEXT,
+    serial INTEGER,
+    class TEXT,
+    pursuit TEXT,
+    manufacturer TEXT,
+    model TEXT,
+    car_name TEXT COLLATE NOCASE,
+    colors TEXT,  -- JSON list
+    bonus TEXT,
+    convertible TEXT,
+    upgrades TEXT,
+    car_info TEXT
+);
+"""
+
+# key: table, value: CREATE INDEX statements; dropped during bulk loads
+index_sql = {
+    "archives": ["CREATE INDEX IF NOT EXISTS archives_path ON archives (path)"],
+    "entries": ["CREATE INDEX IF NOT EXISTS entries_name ON entries (name)"],
+    "meshes": [
+        "CREATE INDEX IF NOT EXISTS meshes_path ON meshes (path, offset)",
+        "CREATE INDEX IF NOT EXISTS meshes_car_name ON meshes (car_name)",
+        "CREATE INDEX IF NOT EXISTS meshes_hash ON meshes (hash)",
+    ],
+    "parts": ["CREATE INDEX IF NOT EXISTS parts_name ON parts (name, PNumTriags)"],
+    "fedata": [
+        "CREATE INDEX IF NOT EXISTS fedata_mesh_id ON fedata (mesh_id)",
+        "CREATE INDEX IF NOT EXISTS fedata_car_name ON fedata (car_name)",
+    ],
+}
+
+def connect(path: pathlib.Path, readonly: bool = False):
+    """ Open (or create) catalog, return sqlite3.Connection """
+    if readonly:
+        return sqlite3.connect(pathlib.Path(path).resolve().as_uri() + "?mode=ro", uri=True)
+    con = sqlite3.connect(path)
+    con.executescript(schema_sql)
+    for statements in index_sql.values():
+        for sql in statements:
+            con.execute(sql)
+    return con
+
+def get_columns(con: sqlite3.Connection, table: str):
+    return [row[1] for row in con.execute(f"PRAGMA table_info({table})")]
+
+def _replace_table(con: sqlite3.Connection, table: str, df: pl.DataFrame, convert: dict = None):
+    """
+    Replace all rows of table with df, matching columns by name. convert:
+    key: column, value: function applied to each value.
+    """
+    columns = [c for c in get_columns(con, table) if c in df.columns]
+    for sql in index_sql[table]:
+        con.execute(f"DROP INDEX IF EXISTS {sql.split()[5]}")
+    con.execute(f"DELETE FROM {table}")
+    rows = df.select(columns).iter_rows()
+    if convert:
+        funcs = [convert.get(c) for c in columns]
+        rows = (tuple(v if f is None or v is None else f(v) for f, v in zip(funcs, row)) for row in rows)
+    con.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+    )
+    for sql in index_sql[table]:
+        con.execute(sql)
+
+def write_viv(con: sqlite3.Connection, df_viv: pl.DataFrame | pl.LazyFrame):
+    """ Replace archives and entries; archive_id is the row index in df_viv """
+    df_viv = df_viv.lazy().collect()
+    _replace_table(con, "archives", df_viv.with_row_index("archive_id").with_columns(pl.col("archive_id").cast(pl.Int64)))
+    _replace_table(con, "entries", scl_libvivanalyze.build_entries(df_viv))
+
+def write_fce(con: sqlite3.Connection, df_fce: pl.DataFrame, df_fedata: pl.DataFrame = None):
+    """
+    Replace meshes, parts and fedata; mesh_id is the row index in df_fce.
+    df_fedata rows are linked to meshes by (path, offset).
+    """
+    df_fce = df_fce.with_row_index("mesh_id").with_columns(pl.col("mesh_id").cast(pl.Int64))
+    _replace_table(con, "meshes", df_fce)
+
+    df_parts = df_fce.select(
+        "mesh_id",
+        pl.int_ranges(pl.col("PGetName").list.len()).alias("part_id"),
+        pl.col("PGetName").alias("name"),
+        pl.col("PGetPos").list.gather_every(3, 0).alias("x"),
+        pl.col("PGetPos").list.gather_every(3, 1).alias("y"),
+        pl.col("PGetPos").list.gather_every(3, 2).alias("z"),
+        "PNumTriags",
+        "PNumVerts",
+    ).explode(
+        ["part_id", "name", "x", "y", "z", "PNumTriags", "PNumVerts"]
+    ).drop_nulls("part_id")
+    _replace_table(con, "parts", df_parts)
+
+    if df_fedata is None or not {"path", "offset"}.issubset(df_fedata.columns):
+        df_fedata = pl.DataFrame({"mesh_id": []}, schema={"mesh_id": pl.Int64})
+    else:
+        df_fedata = df_fce.select("path", "offset", "mesh_id").join(
+            df_fedata, on=["path", "offset"], how="inner", maintain_order="left"
+        )
+    _replace_table(con, "fedata", df_fedata, convert={"colors": json.dumps})
+
+def write_catalog(path: pathlib.Path, df_viv: pl.DataFrame | pl.LazyFrame = None, df_fce: pl.DataFrame = None, df_fedata: pl.DataFrame = None):
+    """
+    Write given catalogs to SQLite file at path in one transaction. Tables of
+    catalogs left None are kept, e.g., bfut_vivanalyze.py writes archives
+    only.
+    """
+    with scl_perf.stage("write_catalog"), contextlib.closing(connect(path)) as con:
+        with con:
+            if df_viv is not None:
+                write_viv(con, df_viv)
+            if df_fce is not None:
+                write_fce(con, df_fce, df_fedata)
+
+
+# lookups
+def query(con: sqlite3.Connection, sql: str, params: tuple = ()):
+    """ Run SQL, return result as pl.DataFrame """
+    cur = con.execute(sql, params)
+    columns = [d[0] for d in cur.description] if cur.description is not None else []
+    return pl.DataFrame(cur.fetchall(), schema=columns, orient="row")
+
+def find_parts(con: sqlite3.Connection, name: str, min_triags: int = None):
+    """ Meshes with a part named name (exact) and more than min_triags triangles """
+    sql = """
+        SELECT m.path, a.format AS archive_format, m.name AS fce, m.car_name, p.name AS part, p.PNumTriags, p.PNumVerts
+        FROM parts p
+        JOIN meshes m ON m.mesh_id = p.mesh_id
+        LEFT JOIN archives a ON a.path = m.path
+        WHERE p.name = ?
+    """
+    params = [name]
+    if min_triags is not None:
+        sql += " AND p.PNumTriags > ?"
+        params.append(min_triags)
+    return query(con, sql + " ORDER BY m.path, m.offset", tuple(params))
+
+def find_cars(con: sqlite3.Connection, pattern: str):
+    """ Meshes whose car_name matches LIKE pattern (case-insensitive), with fedata """
+    return query(con, """
+        SELECT m.car_name, m.path, m.name AS fce, m.version, m.MNumParts, m.MNumTriags,
+               f.manufacturer, f.model, f.class, f.serial
+        FROM meshes m
+        LEFT JOIN fedata f ON f.mesh_id = m.mesh_id
+        WHERE m.car_name LIKE ?
+        ORDER BY m.car_name, m.path, m.offset
+    """, (pattern,))
+
+def find_hash(con: sqlite3.Connection, fce_hash: str):
+    """ All copies of an FCE by content hash """
+    return query(con, """
+        SELECT hash, path, offset, name AS fce, car_name FROM meshes WHERE hash = ? ORDER BY path, offset
+    """, (fce_hash,))
+
+def find_duplicates(con: sqlite3.Connection, min_count: int = 2):
+    """ Content hashes with at least min_count copies """
+    return query(con, """
+        SELECT hash, COUNT(*) AS count, MIN(name) AS fce, MIN(car_name) AS car_name
+        FROM meshes WHERE hash IS NOT NULL
+        GROUP BY hash HAVING COUNT(*) >= ?
+        ORDER BY count DESC, hash
+    """, (min_count,))
+
+def find_entries(con: sqlite3.Connection, name: str):
+    """ Archives containing an entry with name (case-insensitive) """
+    return query(con, """
+        SELECT a.path, a.format, e.entry_id, e.file, e.offset, e.size
+        FROM entries e
+        JOIN archives a ON a.archive_id = e.archive_id
+        WHERE e.name = ?
+        ORDER BY a.path, e.entry_id
+    """, (name.lower(),))
+
+def summary(con: sqlite3.Connection):
+    """ Row count per table """
+    return pl.DataFrame(
+        [(table, con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]) for table in index_sql],
+        schema={"table": str, "rows": int}, orient="row",
+    )